@@ -0,0 +1,496 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import aiohttp
+from datetime import timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import discord
+
+GUILD_ID = 1
+BOT_USER_ID = 2
+ROLE_MESSAGE_ID = 3
+TSQS_UPDATES_ROLE_ID = 4
+WAVE_STICKER_ID = 5
+
+# Channel names accepted by --channels and the variable each one configures.
+# "general" has no reward rules, so it only awards Social Butterfly points.
+CHANNELS = {
+    "general": None,
+    "announcements": "ANNOUNCEMENTS_CHANNEL_ID",
+    "bot_spam": "BOT_SPAM_CHANNEL_ID",
+    "new_members": "NEW_MEMBERS_CHANNEL_ID",
+    "introductions": "INTRODUCTIONS_CHANNEL_ID",
+    "memes": "MEMES_CHANNEL_ID",
+    "cute_pics": "CUTE_PICS_CHANNEL_ID",
+    "nsfw": "NSFW_CHANNEL_ID",
+    "tsqs": "TSQS_CHANNEL_ID",
+    "tsqs_spoiler": "TSQS_SPOILER_CHANNEL_ID",
+    "suggestions": "SUGGESTIONS_CHANNEL_ID",
+    "theorycrafting": "THEORYCRAFTING_CHANNEL_ID",
+    "q_and_a": "Q_AND_A_CHANNEL_ID",
+    "server_discussion": "SERVER_DISCUSSION_CHANNEL_ID",
+    "cool_stuff": "COOL_STUFF_CHANNEL_ID",
+    "show_off": "SHOW_OFF_CHANNEL_ID",
+    "fan_art": "FAN_ART_CHANNEL_ID",
+    "fan_games": "FAN_GAMES_CHANNEL_ID",
+    "fan_books": "FAN_BOOKS_CHANNEL_ID",
+    "book_discussion": "BOOK_DISCUSSION_CHANNEL_ID",
+}
+CHANNEL_IDS = {name: 1000 + i for i, name in enumerate(CHANNELS)}
+
+
+class StubUser:
+    def __init__(self, user_id, name, joined_at=None, guild=None):
+        self.id = user_id
+        self.name = name
+        self.mention = f"<@{user_id}>"
+        self.joined_at = joined_at
+        self.guild = guild
+        self.roles = []
+        self.edits = 0
+
+    async def edit(self, roles=None, **kwargs):
+        self.roles = [StubRole(role.id, "") for role in roles]
+        self.edits += 1
+
+
+class StubChannel:
+    def __init__(self, channel_id, name):
+        self.id = channel_id
+        self.name = name
+        self.sent = 0
+
+    async def send(self, content=None, **kwargs):
+        self.sent += 1
+
+
+class StubThread:
+    def __init__(self, owner_id):
+        self.owner_id = owner_id
+
+
+class StubMessage:
+    def __init__(
+        self,
+        guild,
+        author,
+        channel,
+        content,
+        attachments,
+        stickers,
+        mentions,
+        message_id=0,
+        created_at=None,
+    ):
+        self.id = message_id
+        self.created_at = created_at or discord.utils.utcnow()
+        self.guild = guild
+        self.author = author
+        self.channel = channel
+        self.content = content
+        self.attachments = attachments
+        self.stickers = stickers
+        self.mentions = mentions
+        self.thread = StubThread(author.id)
+
+
+class StubRole:
+    def __init__(self, role_id, name):
+        self.id = role_id
+        self.name = name
+
+    def is_default(self):
+        return False
+
+
+class StubSticker:
+    def __init__(self, sticker_id):
+        self.id = sticker_id
+
+
+class StubGuild:
+    def __init__(self, guild_id, roles, channels):
+        self.id = guild_id
+        self.roles = {role.id: role for role in roles}
+        self.channels = {channel.id: channel for channel in channels}
+        self.sticker_fetches = 0
+
+    def get_role(self, role_id):
+        return self.roles.get(role_id)
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    async def fetch_sticker(self, sticker_id):
+        self.sticker_fetches += 1
+        return StubSticker(sticker_id)
+
+
+class StubReaction:
+    def __init__(self, member, channel_id, emoji):
+        self.message_id = ROLE_MESSAGE_ID
+        self.guild_id = GUILD_ID
+        self.channel_id = channel_id
+        self.user_id = member.id
+        self.member = member
+        self.emoji = emoji
+
+
+def parse_weights(value: str):
+    # "general=60,memes=10" -> (["general", "memes"], [60.0, 10.0])
+    names = []
+    weights = []
+    for part in value.split(","):
+        name, weight = part.split("=", 1)
+        names.append(name.strip())
+        weights.append(float(weight))
+
+    return names, weights
+
+
+def configure_environment(args, root: str) -> None:
+    os.environ["GUILD_ID"] = str(GUILD_ID)
+    os.environ["WAVE_STICKER_ID"] = str(WAVE_STICKER_ID)
+    os.environ["ROLE_MESSAGE_ID"] = str(ROLE_MESSAGE_ID)
+    os.environ["TSQS_UPDATES_ROLE_ID"] = str(TSQS_UPDATES_ROLE_ID)
+    os.environ["ESSENCE_CACHE_SIZE"] = str(args.cache_size)
+    os.environ["ESSENCE_FLUSH_THRESHOLD"] = str(args.flush_threshold)
+    os.environ["WELCOME_WINDOW"] = str(args.welcome_window)
+    os.environ["AWARD_WINDOW"] = str(args.award_window)
+    os.environ["AWARD_CAP"] = str(args.award_cap)
+    os.environ.pop("REWARD_RULES_FILE", None)
+    os.environ.pop("GUILDS_FILE", None)
+
+    for name, variable in CHANNELS.items():
+        if variable is not None:
+            os.environ[variable] = str(CHANNEL_IDS[name])
+
+    if args.log:
+        os.environ["LOG_FILE"] = os.path.join(root, "bench.log")
+
+
+def make_members(count: int, guild, rng: random.Random):
+    now = discord.utils.utcnow()
+    members = []
+    for i in range(count):
+        joined_at = now - timedelta(days=rng.uniform(0, 30))
+        members.append(StubUser(10_000 + i, f"member{i}", joined_at, guild))
+
+    return members
+
+
+def make_traffic(args, guild, members, rng: random.Random):
+    channel_names, channel_weights = parse_weights(args.channels)
+    for name in channel_names:
+        if name not in CHANNELS:
+            raise SystemExit(
+                f"Unknown channel {name!r}, expected one of {list(CHANNELS)}"
+            )
+
+    attachment_counts, attachment_weights = parse_weights(args.attachments)
+    attachment_counts = [int(c) for c in attachment_counts]
+
+    channels = {channel.name: channel for channel in guild.channels.values()}
+    member_weights = [1 / (i + 1) ** args.skew for i in range(len(members))]
+    emojis = [discord.PartialEmoji(name="🪰"), discord.PartialEmoji(name="👍")]
+
+    events = []
+    for i in range(args.events):
+        if rng.random() < args.joins:
+            joined_at = discord.utils.utcnow()
+            member = StubUser(1_000_000 + i, f"newcomer{i}", joined_at, guild)
+            events.append(("join", member))
+            continue
+
+        author = rng.choices(members, member_weights)[0]
+
+        if rng.random() < args.reactions:
+            emoji = rng.choice(emojis)
+            events.append(
+                ("reaction", StubReaction(author, CHANNEL_IDS["general"], emoji))
+            )
+            continue
+
+        channel = channels[rng.choices(channel_names, channel_weights)[0]]
+        attachments = [object()] * rng.choices(attachment_counts, attachment_weights)[0]
+        stickers = [object()] if rng.random() < args.stickers else []
+        content = "" if attachments and rng.random() < 0.5 else "hello there"
+        mentions = rng.sample(members, 1) if channel.name == "new_members" else []
+
+        message = StubMessage(
+            guild, author, channel, content, attachments, stickers, mentions, i
+        )
+        events.append(("message", message))
+
+    return events
+
+
+def make_history(events):
+    # The same messages as if they had been sent while the bot was offline
+    sent = discord.utils.utcnow() - timedelta(days=30)
+    history = {}
+    for kind, message in events:
+        if kind != "message":
+            continue
+
+        old = StubMessage(
+            message.guild,
+            message.author,
+            message.channel,
+            message.content,
+            message.attachments,
+            message.stickers,
+            message.mentions,
+            message.id,
+            sent + timedelta(seconds=message.id),
+        )
+        history.setdefault(message.channel.id, []).append(old)
+
+    return history
+
+
+async def run_backfill(bot, guild, state, events, batch_size: int):
+    from sarica.backfill import Backfill
+
+    history = make_history(events)
+
+    async def fake_history(channel, after):
+        for message in history.get(channel.id, ()):
+            if after is None or message.id > after:
+                yield message
+
+    channels = [guild.get_channel(channel_id) for channel_id in history]
+    backfill = Backfill(state, bot.user.id, fake_history, batch_size=batch_size)
+
+    start = time.perf_counter()
+    await backfill.run(channels)
+    elapsed = time.perf_counter() - start
+
+    # A second run resumes from the checkpoints and finds nothing new
+    again = Backfill(state, bot.user.id, fake_history, batch_size=batch_size)
+    await again.run(channels)
+    return backfill, elapsed, again.scanned
+
+
+def percentile(samples, q: float) -> float:
+    if len(samples) == 0:
+        return 0.0
+
+    return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+async def replay(args, root: str):
+    from sarica.bot import SaricaBot
+
+    guild = StubGuild(
+        GUILD_ID,
+        [StubRole(TSQS_UPDATES_ROLE_ID, "TSQS Updates")],
+        [StubChannel(CHANNEL_IDS[name], name) for name in CHANNELS],
+    )
+
+    rng = random.Random(args.seed)
+    members = make_members(args.members, guild, rng)
+    events = make_traffic(args, guild, members, rng)
+
+    bot = SaricaBot()
+    bot._connection.user = StubUser(BOT_USER_ID, "Sarica")
+    bot.get_guild = lambda guild_id: guild if guild_id == GUILD_ID else None
+    bot.get_channel = guild.get_channel
+
+    # Feeds are loaded but never polled, so the session is never used
+    bot.http_session = aiohttp.ClientSession()
+    await bot.load_guilds()
+    state = bot.get_state(GUILD_ID)
+
+    # Every commit passes through the trace callback on the database thread
+    commits = [0]
+
+    def trace(statement):
+        if statement.startswith("COMMIT"):
+            commits[0] += 1
+
+    await state.db.run(state.db.conn.set_trace_callback, trace)
+
+    handlers = {
+        "message": bot.on_message,
+        "reaction": bot.on_raw_reaction_add,
+        "join": bot.on_member_join,
+    }
+    latencies = {kind: [] for kind in handlers}
+
+    async def dispatch(kind, event):
+        start = time.perf_counter()
+        await handlers[kind](event)
+        latencies[kind].append(time.perf_counter() - start)
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+
+    for i in range(0, len(events), args.burst):
+        if args.rate > 0:
+            delay = start + i / args.rate - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+        burst = events[i : i + args.burst]
+        await asyncio.gather(*[dispatch(kind, event) for kind, event in burst])
+
+    replayed = loop.time() - start
+    state.welcomes.close()
+    await state.welcomes.flush()
+    state.role_edits.close()
+    await state.role_edits.flush()
+    await bot.flush_essences()
+    elapsed = loop.time() - start
+
+    live_commits = commits[0]
+    backfill = None
+    if args.backfill:
+        backfill = await run_backfill(bot, guild, state, events, args.backfill_batch)
+        backfill = backfill + (commits[0] - live_commits,)
+
+    # Queued messages trickle out at the channel rate, not part of the timing
+    await bot.outbox.drain()
+    bot.db_pool.close()
+    await bot.http_session.close()
+    return guild, state, latencies, live_commits, replayed, elapsed, backfill
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Replay synthetic traffic through the SaricaBot handlers"
+    )
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--members", type=int, default=1000)
+    parser.add_argument(
+        "--skew",
+        type=float,
+        default=1.0,
+        help="Zipf exponent for how activity is spread over members",
+    )
+    parser.add_argument(
+        "--channels",
+        default="general=50,memes=10,tsqs=10,bot_spam=5,fan_art=3,show_off=2,"
+        "new_members=5,introductions=2,suggestions=3,q_and_a=5,cute_pics=5",
+        help="Weighted channel mix, name=weight pairs",
+    )
+    parser.add_argument(
+        "--attachments",
+        default="0=85,1=12,4=3",
+        help="Weighted attachment counts, count=weight pairs",
+    )
+    parser.add_argument("--stickers", type=float, default=0.02)
+    parser.add_argument(
+        "--reactions", type=float, default=0.05, help="Share of events that react"
+    )
+    parser.add_argument(
+        "--joins", type=float, default=0.01, help="Share of events that are joins"
+    )
+    parser.add_argument("--welcome-window", type=float, default=0.5)
+    parser.add_argument(
+        "--award-window",
+        type=float,
+        default=10,
+        help="Seconds awards are collected before being applied, 0 to apply at once",
+    )
+    parser.add_argument(
+        "--award-cap",
+        type=int,
+        default=0,
+        help="Points per member and class per minute, 0 for no cap",
+    )
+    parser.add_argument(
+        "--burst", type=int, default=1, help="Events dispatched concurrently"
+    )
+    parser.add_argument(
+        "--rate", type=float, default=0, help="Events per second, 0 for unthrottled"
+    )
+    parser.add_argument(
+        "--backfill",
+        action="store_true",
+        help="Afterwards backfill the same messages as offline history",
+    )
+    parser.add_argument("--backfill-batch", type=int, default=2000)
+    parser.add_argument("--cache-size", type=int, default=1024)
+    parser.add_argument("--flush-threshold", type=int, default=64)
+    parser.add_argument(
+        "--log", action="store_true", help="Write the JSON log to a temp file"
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="sarica-bench-") as root:
+        configure_environment(args, root)
+
+        if args.log:
+            from sarica.log import setup_logging
+
+            setup_logging()
+
+        # Database creates guilds/ relative to the working directory
+        os.chdir(root)
+        try:
+            guild, state, latencies, commits, replayed, elapsed, backfill = asyncio.run(
+                replay(args, root)
+            )
+        finally:
+            os.chdir(cwd)
+
+        if args.log:
+            from sarica.log import stop_logging
+
+            stop_logging()
+
+    total = sum(len(samples) for samples in latencies.values())
+    print(
+        f"{total} events from {args.members} members in {replayed:.2f}s "
+        f"({total / replayed:.0f} events/s), {elapsed:.2f}s with the final flush"
+    )
+
+    for kind, samples in latencies.items():
+        samples.sort()
+        print(
+            f"{kind:>10}: {len(samples):7d} events, "
+            f"p50 {percentile(samples, 0.5) * 1e6:8.1f} us, "
+            f"p99 {percentile(samples, 0.99) * 1e6:8.1f} us"
+        )
+
+    cache = state.essences
+    lookups = cache.hits + cache.misses
+    hit_rate = cache.hits / lookups * 100 if lookups > 0 else 0.0
+    print(f"DB commits: {commits} ({commits / elapsed:.1f}/s)")
+    print(f"Essence cache: {hit_rate:.1f}% hits over {lookups} lookups")
+
+    from sarica.metrics import AWARD_POINTS_CAPPED
+
+    capped = AWARD_POINTS_CAPPED.labels().value
+    print(f"Awards: {state.awards.collapsed} collapsed, {capped} points capped")
+
+    edits = state.role_edits
+    print(f"Role edits: {edits.edits}, {edits.collapsed} reactions batched")
+
+    joins = len(latencies["join"])
+    welcomes = guild.get_channel(CHANNEL_IDS["new_members"]).sent
+    print(
+        f"Welcomes: {welcomes} messages for {joins} joins, "
+        f"{guild.sticker_fetches} sticker fetches"
+    )
+
+    if backfill is not None:
+        result, seconds, rescanned, backfill_commits = backfill
+        print(
+            f"Backfill: {result.scanned} messages in {seconds:.2f}s "
+            f"({result.scanned / seconds:.0f} messages/s), {result.points} exp, "
+            f"{backfill_commits} commits, {rescanned} rescanned on resume"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+import os
+import sys
+import time
+import random
+import sqlite3
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import numpy as np
+from sarica.essence import Essence, UserClass, CLASS_COUNT, affinity_to_grade
+from sarica.recompute import GRADES, Recomputed
+
+
+def make_rows(members: int, classes: int, skew: float, rng: random.Random):
+    # Most members dabble in a few classes, a handful grind one of them.
+    # Affinities start out unset, as if the formula had just changed.
+    rows = []
+    for member_id in range(10_000, 10_000 + members):
+        scale = rng.paretovariate(skew) * 20
+        for class_id in rng.sample(range(CLASS_COUNT), rng.randint(1, classes)):
+            points = int(rng.expovariate(1 / scale))
+            rows.append((member_id, class_id, points, 0.0))
+
+    return rows
+
+
+def recompute_objects(rows):
+    # What recomputing meant before: one Essence per member, built up by
+    # add_points, with every derived value read through the objects
+    essences = {}
+    for member_id, class_id, points, _ in rows:
+        essence = essences.get(member_id)
+        if essence is None:
+            essence = Essence()
+            essences[member_id] = essence
+        essence.add_points(UserClass(class_id), points)
+
+    results = {}
+    for member_id, essence in essences.items():
+        classes = [
+            (c.user_class.value, c.affinity, affinity_to_grade(c.affinity))
+            for c in essence.get_class_list()
+        ]
+        results[member_id] = (
+            essence.level,
+            essence.exp,
+            essence.get_realm(),
+            essence.get_stage(),
+            essence.get_path(),
+            classes,
+        )
+
+    return results
+
+
+def recompute_vectorised(rows):
+    recomputed = Recomputed(rows)
+    return (
+        recomputed,
+        recomputed.get_grades(),
+        recomputed.get_realms(),
+        recomputed.get_stages(),
+        recomputed.get_paths(),
+    )
+
+
+def check(objects, vectorised) -> int:
+    recomputed, grades, realms, stages, paths = vectorised
+    mismatches = 0
+    for i, member_id in enumerate(recomputed.member_ids.tolist()):
+        level, exp, realm, stage, path, classes = objects[member_id]
+        same = (
+            level == recomputed.levels[i]
+            and exp == recomputed.exps[i]
+            and realm.value == realms[i]
+            and stage.value == stages[i]
+            and path.value == paths[i]
+        )
+        for class_id, affinity, grade in classes:
+            same = same and np.isclose(affinity, recomputed.affinities[i, class_id])
+            same = same and grade == GRADES[grades[i, class_id]]
+
+        if not same:
+            mismatches += 1
+
+    return mismatches
+
+
+def write_back(path: str, rows, recomputed: Recomputed):
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE members (member_id INTEGER PRIMARY KEY, exp INTEGER, level INTEGER)"
+    )
+    conn.execute(
+        "CREATE TABLE classes (member_id INTEGER, class_id INTEGER, points INTEGER, affinity REAL DEFAULT 0, PRIMARY KEY (member_id, class_id))"
+    )
+    conn.executemany(
+        "INSERT INTO classes (member_id, class_id, points, affinity) VALUES (?, ?, ?, ?)",
+        rows,
+    )
+    conn.commit()
+
+    start = time.perf_counter()
+    conn.executemany(
+        "INSERT OR REPLACE INTO members (member_id, exp, level) VALUES (?, ?, ?)",
+        recomputed.member_rows(),
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO classes (member_id, class_id, points, affinity) VALUES (?, ?, ?, ?)",
+        recomputed.class_rows(),
+    )
+    conn.commit()
+    elapsed = time.perf_counter() - start
+
+    # Recomputing again under the same formula finds nothing to write
+    classes = conn.execute(
+        "SELECT member_id, class_id, points, affinity FROM classes"
+    ).fetchall()
+    members = conn.execute("SELECT member_id, exp, level FROM members").fetchall()
+    again = Recomputed(classes, members)
+
+    conn.close()
+    return elapsed, again.written
+
+
+def best_of(repeat: int, func, *args):
+    best = None
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Compare the vectorised Essence recompute with per-member objects"
+    )
+    parser.add_argument("--members", type=int, default=100_000)
+    parser.add_argument(
+        "--classes", type=int, default=8, help="Most classes one member has points in"
+    )
+    parser.add_argument(
+        "--skew", type=float, default=1.5, help="Pareto shape of member activity"
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rows = make_rows(args.members, args.classes, args.skew, random.Random(args.seed))
+    print(f"{args.members} members, {len(rows)} class rows")
+
+    objects_time, objects = best_of(args.repeat, recompute_objects, rows)
+    vector_time, vectorised = best_of(args.repeat, recompute_vectorised, rows)
+    print(f"   objects: {objects_time * 1000:9.1f} ms")
+    print(
+        f"vectorised: {vector_time * 1000:9.1f} ms "
+        f"({objects_time / vector_time:.1f}x faster)"
+    )
+
+    mismatches = check(objects, vectorised)
+    print(f"Members that differ: {mismatches}")
+
+    with tempfile.TemporaryDirectory(prefix="sarica-bench-") as root:
+        path = os.path.join(root, "guild.db")
+        elapsed, rewritten = write_back(path, rows, vectorised[0])
+    print(
+        f"Write back of {vectorised[0].written} members in one transaction: "
+        f"{elapsed * 1000:.1f} ms, {rewritten} to rewrite on a second pass"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import os
+import sys
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from sarica.table import make_table
+
+
+def legacy_make_table(rows, header=None):
+    # The PrettyTable based renderer make_table replaced, kept for comparison
+    from prettytable import PrettyTable, TableStyle
+
+    table = PrettyTable()
+    table.set_style(TableStyle.SINGLE_BORDER)
+
+    if header is not None:
+        table.header = True
+        table.field_names = header
+    else:
+        table.header = False
+
+    for row in rows:
+        table.add_row(row, divider=True)
+
+    text = str(table)
+
+    x = 0
+    y = 0
+    w = text.index("\n") - 1
+    h = len(rows) * 2 + (2 if header is not None else 0)
+
+    for i, c in enumerate(text):
+        if c == "\n":
+            x = 0
+            y += 1
+            continue
+
+        if x == 0 and y == 0:
+            text = text[:i] + "╔" + text[i + 1 :]
+        elif x == 0 and y == h:
+            text = text[:i] + "╚" + text[i + 1 :]
+        elif x == w and y == 0:
+            text = text[:i] + "╗" + text[i + 1 :]
+        elif x == w and y == h:
+            text = text[:i] + "╝" + text[i + 1 :]
+        elif x == 0:
+            text = text[:i] + "║" + text[i + 1 :]
+        elif x == w:
+            text = text[:i] + "║" + text[i + 1 :]
+        elif y == 0:
+            text = text[:i] + "═" + text[i + 1 :]
+        elif y == h:
+            text = text[:i] + "═" + text[i + 1 :]
+
+        x += 1
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the /essence table renderer"
+    )
+    parser.add_argument("--rows", type=int, nargs="+", default=[4, 19, 100, 500])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    header = ["Class", "Alignment", "Affinity"]
+
+    try:
+        import prettytable  # noqa: F401
+
+        has_legacy = True
+    except ImportError:
+        has_legacy = False
+        print("prettytable is not installed, skipping the legacy renderer")
+
+    for count in args.rows:
+        rows = [[f"Class {i}", "Primordial", "SS+"] for i in range(count)]
+        number = max(1, 2000 // count)
+
+        native = min(
+            timeit.repeat(
+                lambda: make_table(rows, header), number=number, repeat=args.repeat
+            )
+        )
+        line = f"{count:>5} rows: make_table {native / number * 1e6:10.1f} us"
+
+        if has_legacy:
+            assert legacy_make_table(rows, header) == make_table(rows, header)
+            legacy = min(
+                timeit.repeat(
+                    lambda: legacy_make_table(rows, header),
+                    number=number,
+                    repeat=args.repeat,
+                )
+            )
+            line += (
+                f", legacy {legacy / number * 1e6:10.1f} us ({legacy / native:.1f}x)"
+            )
+
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
+import time
+
+started = time.perf_counter()
+
 from dotenv import load_dotenv
 from sarica.bot import run
 
 load_dotenv()
-run()
+run(started)
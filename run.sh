@@ -22,7 +22,14 @@ while [ $running -eq 1 ]; do
     export SARICA_VERSION_HASH
 
     source .venv/bin/activate
-    pip install -r requirements.txt
-    python3 main.py > latest.log 2>&1 || running=0
+
+    # Only reinstall when requirements.txt changed since the last install
+    requirements_hash=$(sha256sum requirements.txt | cut -d ' ' -f 1)
+    if [ "$requirements_hash" != "$(cat .venv/.requirements-hash 2>/dev/null)" ]; then
+      pip install -r requirements.txt && echo "$requirements_hash" > .venv/.requirements-hash
+    fi
+
+    # Sarica writes and rotates latest.log itself, only crashes end up here
+    LOG_FILE=latest.log python3 main.py >> crash.log 2>&1 || running=0
   fi
 done
@@ -1,7 +1,36 @@
-__all__ = ["bot", "feed", "sql", "table", "essence"]
+import importlib
 
-from . import bot
-from . import feed
-from . import sql
-from . import table
-from . import essence
+__all__ = [
+    "bot",
+    "feed",
+    "sql",
+    "table",
+    "essence",
+    "cache",
+    "rewards",
+    "card",
+    "leaderboard",
+    "log",
+    "metrics",
+    "guild",
+    "reload",
+    "welcome",
+    "outbox",
+    "awards",
+    "backfill",
+    "roles",
+    "recompute",
+    "state",
+    "subscriptions",
+]
+
+
+# Submodules are imported on first access, so importing a light module such as
+# sarica.table does not pull in discord.py and aiohttp as well. This helps the
+# tests and benchmarks, the bot itself imports sarica.bot and with it nearly
+# every module.
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f".{name}", __name__)
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
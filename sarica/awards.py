@@ -0,0 +1,137 @@
+import asyncio
+import logging
+from typing import Dict, Optional, Tuple
+from .essence import UserClass
+from .cache import EssenceCache
+from .metrics import AWARDS_COLLAPSED, AWARD_POINTS_CAPPED
+
+
+log = logging.getLogger(__name__)
+
+
+class AwardAccumulator:
+    def __init__(
+        self,
+        essences: EssenceCache,
+        window: float = 10.0,
+        cap: int = 0,
+        cap_window: float = 60.0,
+    ):
+        self.essences = essences
+        self.window = window
+        self.cap = cap
+        self.cap_window = cap_window
+
+        # member id -> {(UserClass, channel id): points} waiting to be applied
+        self.pending: Dict[int, Dict[Tuple[UserClass, Optional[int]], int]] = {}
+        # (member id, UserClass) -> [window start, points awarded in it]
+        self.capped = {}
+        self.timer = None
+        self.collapsed = 0
+
+    async def add(
+        self, member_id, user_class: UserClass, points: int, channel_id=None
+    ) -> int:
+        points = self.limit(member_id, user_class, points)
+        if points <= 0:
+            return 0
+
+        deltas = self.pending.setdefault(member_id, {})
+        key = (user_class, channel_id)
+        if key in deltas:
+            deltas[key] += points
+            self.collapsed += 1
+            AWARDS_COLLAPSED.inc()
+        else:
+            deltas[key] = points
+
+        if self.window <= 0:
+            await self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.ensure_future(self.flush_later())
+
+        return points
+
+    def limit(self, member_id, user_class: UserClass, points: int) -> int:
+        if self.cap <= 0 or points <= 0:
+            return points
+
+        now = asyncio.get_running_loop().time()
+        key = (member_id, user_class)
+        entry = self.capped.get(key)
+        if entry is None or now - entry[0] >= self.cap_window:
+            entry = [now, 0]
+            self.capped[key] = entry
+
+        allowed = min(points, self.cap - entry[1])
+        entry[1] += max(allowed, 0)
+
+        if allowed < points:
+            AWARD_POINTS_CAPPED.inc(points - max(allowed, 0))
+
+        return allowed
+
+    async def flush_later(self) -> None:
+        await asyncio.sleep(self.window)
+        self.timer = None
+
+        try:
+            await self.flush()
+        except Exception:
+            log.exception("Failed to apply awards")
+
+    async def flush(self) -> None:
+        pending = self.pending
+        self.pending = {}
+
+        try:
+            while len(pending) > 0:
+                member_id = next(iter(pending))
+                await self.apply(member_id, pending.pop(member_id))
+        except Exception:
+            # Members not reached yet wait for the next flush
+            for member_id, deltas in pending.items():
+                self.restore(member_id, deltas)
+            raise
+
+        self.prune()
+
+    async def flush_member(self, member_id) -> None:
+        deltas = self.pending.pop(member_id, None)
+        if deltas is not None:
+            await self.apply(member_id, deltas)
+
+    async def apply(self, member_id, deltas) -> None:
+        # One ledger entry per class and channel however many awards were
+        # collected
+        applied = 0
+        try:
+            for (user_class, channel_id), points in deltas.items():
+                await self.essences.add_points(
+                    member_id, user_class, points, channel_id
+                )
+                applied += 1
+        except Exception:
+            # add_points only raises before the points are added
+            keys = list(deltas)[applied:]
+            self.restore(member_id, {key: deltas[key] for key in keys})
+            raise
+
+    def restore(self, member_id, deltas) -> None:
+        pending = self.pending.setdefault(member_id, {})
+        for key, points in deltas.items():
+            pending[key] = pending.get(key, 0) + points
+
+    def prune(self) -> None:
+        if len(self.capped) == 0:
+            return
+
+        now = asyncio.get_running_loop().time()
+        expired = [k for k, v in self.capped.items() if now - v[0] >= self.cap_window]
+        for key in expired:
+            del self.capped[key]
+
+    def close(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
@@ -0,0 +1,121 @@
+import asyncio
+import bisect
+import logging
+import discord
+from typing import AsyncIterator, Callable, Dict, Optional, Tuple
+from . import rewards
+from .essence import UserClass
+from .sql import ROLLUP_SECONDS
+
+
+log = logging.getLogger(__name__)
+
+CHECKPOINT_KEY = "backfill_checkpoint_{}"
+
+
+async def channel_history(
+    channel, after: Optional[int]
+) -> AsyncIterator[discord.Message]:
+    after = discord.Object(after) if after is not None else None
+    async for message in channel.history(limit=None, after=after, oldest_first=True):
+        yield message
+
+
+class Backfill:
+    def __init__(
+        self,
+        state,
+        bot_user_id: int,
+        history: Callable[..., AsyncIterator[discord.Message]] = channel_history,
+        batch_size: int = 2000,
+        yield_every: int = 100,
+        tracked_since: Optional[float] = None,
+    ):
+        self.state = state
+        self.bot_user_id = bot_user_id
+        self.tracked_since = tracked_since
+        self.history = history
+        self.batch_size = batch_size
+        self.yield_every = yield_every
+        self.sessions = []
+        self.scanned = 0
+        self.skipped = 0
+        self.awarded = 0
+        self.points = 0
+
+    async def load_sessions(self) -> None:
+        # Messages sent while the bot was running were already awarded live
+        db = self.state.db
+        sessions = await db.get_sessions()
+        sessions = [s for s in sessions if s[0] != db.session_started]
+        sessions.append((db.session_started, float("inf")))
+        sessions.sort()
+
+        # Sessions are only recorded since they were introduced, before that
+        # the bot was awarding live from the time it joined the guild
+        if self.tracked_since is not None and self.tracked_since < sessions[0][0]:
+            sessions.insert(0, (self.tracked_since, sessions[0][0]))
+
+        self.sessions = sessions
+
+    def was_online(self, timestamp: float) -> bool:
+        i = bisect.bisect_right(self.sessions, (timestamp, float("inf"))) - 1
+        return i >= 0 and timestamp <= self.sessions[i][1]
+
+    async def run(self, channels) -> None:
+        await self.load_sessions()
+        for channel in channels:
+            await self.run_channel(channel)
+
+    async def run_channel(self, channel) -> None:
+        key = CHECKPOINT_KEY.format(channel.id)
+        checkpoint = await self.state.db.get(key)
+        after = int(checkpoint) if checkpoint is not None else None
+
+        deltas: Dict[int, Dict[Tuple[UserClass, int], int]] = {}
+        count = 0
+        last_id = None
+
+        async for message in self.history(channel, after):
+            self.scanned += 1
+            count += 1
+            last_id = message.id
+
+            if message.author.id == self.bot_user_id or self.was_online(
+                message.created_at.timestamp()
+            ):
+                self.skipped += 1
+            else:
+                self.add(deltas, message)
+
+            # Points and the checkpoint are written together, a restart
+            # resumes after the last message that was counted.
+            if count % self.batch_size == 0:
+                await self.state.essences.apply_deltas(
+                    deltas, {key: str(last_id)}, channel.id
+                )
+                deltas = {}
+            elif count % self.yield_every == 0:
+                await asyncio.sleep(0)
+
+        if last_id is not None:
+            await self.state.essences.apply_deltas(
+                deltas, {key: str(last_id)}, channel.id
+            )
+
+        log.info("Backfilled %d messages from channel %d", count, channel.id)
+
+    def add(self, deltas, message: discord.Message) -> None:
+        awards = rewards.get_message_awards(message, self.state.config.reward_rules)
+        points = deltas.setdefault(message.author.id, {})
+
+        # Points are written at the hour they were earned in, so old history
+        # lands in old rollups rather than this week's leaderboard
+        timestamp = message.created_at.timestamp()
+        hour = int(timestamp // ROLLUP_SECONDS) * ROLLUP_SECONDS
+        for user_class, amount, _ in awards:
+            key = (user_class, hour)
+            points[key] = points.get(key, 0) + amount
+            self.points += amount
+
+        self.awarded += 1
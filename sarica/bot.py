@@ -1,84 +1,197 @@
 import os
 import sys
+import json
+import time
+import hashlib
 import discord
 import asyncio
+import logging
+import aiohttp
 from datetime import datetime, timedelta
 from discord import app_commands
-from .sql import Database
-from .feed import query_rr
-from .table import make_table
+from .sql import DatabasePool
+from .backfill import Backfill
+from .state import GuildState
+from .subscriptions import Subscription
+from . import card, feed, rewards, table
+from . import guild as guilds
+from .leaderboard import get_level_for_exp
 from .essence import UserClass
+from .reload import Reloader
+from .welcome import join_mentions
+from .outbox import Outbox, Lane
+from .log import setup_logging
+from . import metrics
+from .metrics import HANDLER_SECONDS, EVENTS, AWARDS, AWARD_POINTS, Timer
 from typing import Optional
 
 
+log = logging.getLogger(__name__)
+awards_log = logging.getLogger("sarica.awards")
+
+ON_MESSAGE_SECONDS = HANDLER_SECONDS.labels("on_message")
+ON_REACTION_SECONDS = HANDLER_SECONDS.labels("on_raw_reaction_add")
+ESSENCE_CMD_SECONDS = HANDLER_SECONDS.labels("essence_cmd")
+FEED_UPDATE_SECONDS = HANDLER_SECONDS.labels("check_for_feed_updates")
+MESSAGE_EVENTS = EVENTS.labels("message")
+REACTION_EVENTS = EVENTS.labels("reaction_add")
+CLASS_AWARDS = {c: AWARDS.labels(c.name) for c in UserClass}
+CLASS_AWARD_POINTS = {c: AWARD_POINTS.labels(c.name) for c in UserClass}
+
+WEEK_SECONDS = 7 * 24 * 60 * 60
+DAY_SECONDS = 24 * 60 * 60
+
+
 class SaricaBot(discord.Client):
-    def __init__(self):
+    def __init__(self, started: Optional[float] = None):
+        # Time spent in each startup phase until on_ready, in order
+        self.startup_phases = []
+        self.phase_started = started if started is not None else time.perf_counter()
+        self.mark_startup("imports")
+
         intents = discord.Intents.default()
         intents.message_content = True
         intents.members = True
         super().__init__(intents=intents)
 
-        self.guild = discord.Object(id=os.getenv("GUILD_ID"))
         self.tree = app_commands.CommandTree(self)
 
-        self.announcements_channel_id = int(os.getenv("ANNOUNCEMENTS_CHANNEL_ID"))
-        self.bot_spam_channel_id = int(os.getenv("BOT_SPAM_CHANNEL_ID"))
-
-        self.new_members_channel_id = int(os.getenv("NEW_MEMBERS_CHANNEL_ID"))
-        self.memes_channel_id = int(os.getenv("MEMES_CHANNEL_ID"))
-        self.cute_pics_channel_id = int(os.getenv("CUTE_PICS_CHANNEL_ID"))
-        self.nsfw_channel_id = int(os.getenv("NSFW_CHANNEL_ID"))
-        self.tsqs_channel_id = int(os.getenv("TSQS_CHANNEL_ID"))
-        self.tsqs_spoiler_channel_id = int(os.getenv("TSQS_SPOILER_CHANNEL_ID"))
-        self.suggestions_channel_id = int(os.getenv("SUGGESTIONS_CHANNEL_ID"))
-        self.theorycrafting_channel_id = int(os.getenv("THEORYCRAFTING_CHANNEL_ID"))
-        self.q_and_a_channel_id = int(os.getenv("Q_AND_A_CHANNEL_ID"))
-        self.server_discussion_channel_id = int(
-            os.getenv("SERVER_DISCUSSION_CHANNEL_ID")
-        )
-        self.cool_stuff_channel_id = int(os.getenv("COOL_STUFF_CHANNEL_ID"))
-        self.show_off_channel_id = int(os.getenv("SHOW_OFF_CHANNEL_ID"))
-        self.intro_channel_id = int(os.getenv("INTRODUCTIONS_CHANNEL_ID"))
-        self.fan_art_channel_id = int(os.getenv("FAN_ART_CHANNEL_ID"))
-        self.fan_games_channel_id = int(os.getenv("FAN_GAMES_CHANNEL_ID"))
-        self.fan_books_channel_id = int(os.getenv("FAN_BOOKS_CHANNEL_ID"))
-        self.book_discussion_channel_id = int(os.getenv("BOOK_DISCUSSION_CHANNEL_ID"))
-
-        self.wave_sticker_id = int(os.getenv("WAVE_STICKER_ID"))
-
-        self.role_message_id = int(os.getenv("ROLE_MESSAGE_ID"))
-        self.tsqs_updates_role_id = int(os.getenv("TSQS_UPDATES_ROLE_ID"))
-        self.role_mapping = {discord.PartialEmoji(name="🪰"): self.tsqs_updates_role_id}
-
-        self.db = Database()
+        # One gateway session serves every configured guild, each with its
+        # own database opened on demand from a bounded pool.
+        self.guild_configs = guilds.get_guild_configs()
+        self.guild_states = {}
+
+        # Created in setup_hook, which never runs if logging in fails
+        self.http_session = None
+        self.db_pool = DatabasePool(
+            max_open=int(os.getenv("DB_POOL_SIZE", "8")),
+            idle_timeout=float(os.getenv("DB_IDLE_TIMEOUT", "300")),
+        )
+
+        self.essence_flush_interval = int(os.getenv("ESSENCE_FLUSH_INTERVAL", "30"))
+
+        # Awards go to an append-only ledger that is folded into the classes
+        # snapshot on this interval. Folded entries are kept for a while to
+        # audit or undo awards, hourly rollups for "earned since" queries.
+        self.ledger_compact_interval = int(os.getenv("LEDGER_COMPACT_INTERVAL", "3600"))
+        self.ledger_retention = (
+            float(os.getenv("LEDGER_RETENTION_DAYS", "30")) * DAY_SECONDS
+        )
+        self.rollup_retention = (
+            float(os.getenv("ROLLUP_RETENTION_DAYS", "90")) * DAY_SECONDS
+        )
+        self.metrics_server = None
+
+        # Handlers queue their messages here and return right away
+        self.outbox = Outbox(
+            self,
+            rate=float(os.getenv("OUTBOX_RATE", "1")),
+            burst=int(os.getenv("OUTBOX_BURST", "5")),
+        )
+        self.reloader = Reloader()
+        self.mark_startup("init")
+
+    def mark_startup(self, phase: str):
+        now = time.perf_counter()
+        self.startup_phases.append((phase, now - self.phase_started))
+        self.phase_started = now
 
     async def on_ready(self):
-        print(f"Logged in as {self.user}", flush=True)
+        log.info("Logged in as %s", self.user)
+
+        # on_ready fires again after every reconnect, only the first one counts
+        if self.phase_started is None:
+            return
+
+        self.mark_startup("connect")
+        self.phase_started = None
+
+        total = sum(seconds for _, seconds in self.startup_phases)
+        log.info(
+            "Ready in %.2fs (%s)",
+            total,
+            ", ".join(
+                f"{phase} {seconds:.2f}s" for phase, seconds in self.startup_phases
+            ),
+            extra={"phases": dict(self.startup_phases)},
+        )
 
         version = os.getenv("SARICA_VERSION_HASH")
-        await self.bot_spam(f"I'm back online!\n(Version: {version})")
+        for state in self.guild_states.values():
+            self.bot_spam(
+                state, f"I'm back online!\n(Version: {version}, ready in {total:.1f}s)"
+            )
+
+    def get_state(self, guild_id) -> Optional[GuildState]:
+        return self.guild_states.get(guild_id)
+
+    async def load_guilds(self):
+        for guild_id, config in self.guild_configs.items():
+            await self.add_guild(config)
+
+    async def add_guild(self, config: guilds.GuildConfig) -> GuildState:
+        guild_id = config.guild_id
+        state = GuildState(
+            config, self.db_pool.get(guild_id), self.http_session, self.send_welcome
+        )
+        await state.load()
+        self.guild_states[guild_id] = state
+        return state
 
     async def on_member_join(self, member: discord.Member):
-        print(f"{member.name} has joined the server", flush=True)
+        log.info(
+            "%s has joined the server", member.name, extra={"member_id": member.id}
+        )
 
         guild = member.guild
         if guild is None:
             return
 
-        channel = guild.get_channel(self.new_members_channel_id)
-        if channel is None:
-            print("Warning: New members channel not found", flush=True)
+        state = self.get_state(guild.id)
+        if state is None or state.config.new_members_channel_id is None:
             return
 
-        await channel.send(f"Welcome to the Wraithaven server, {member.mention}!")
+        await state.welcomes.add(member)
 
-        sticker = await guild.fetch_sticker(self.wave_sticker_id)
-        if sticker is None:
+    async def send_welcome(self, state: GuildState, members):
+        guild = self.get_guild(state.config.guild_id)
+        if guild is None:
+            log.warning("Guild not found")
             return
 
-        await channel.send(stickers=[sticker])
+        # One message with the sticker attached welcomes the whole batch
+        mentions = join_mentions([member.mention for member in members])
+        content = state.config.welcome_message.format(mention=mentions, guild=guild)
+
+        sticker = await self.get_wave_sticker(state, guild)
+        stickers = [sticker] if sticker is not None else []
+
+        log.info("Welcoming %d new members", len(members))
+        self.outbox.send(
+            state.config.new_members_channel_id, content, Lane.Welcome, stickers
+        )
+
+    async def get_wave_sticker(self, state: GuildState, guild: discord.Guild):
+        sticker_id = state.config.wave_sticker_id
+        if sticker_id is None:
+            return None
+
+        if state.wave_sticker is None or state.wave_sticker.id != sticker_id:
+            sticker = self.get_sticker(sticker_id)
+            if sticker is None:
+                try:
+                    sticker = await guild.fetch_sticker(sticker_id)
+                except discord.HTTPException as e:
+                    log.warning("Could not fetch the wave sticker: %s", e)
+                    return None
+
+            state.wave_sticker = sticker
+
+        return state.wave_sticker
 
     async def setup_hook(self):
+        self.mark_startup("login")
+
         @self.tree.command()
         @app_commands.describe(
             public="If true, this command will be visible to everyone.",
@@ -89,7 +202,8 @@ class SaricaBot(discord.Client):
             public: bool = False,
             member: Optional[discord.Member] = None,
         ):
-            await self.essence_cmd(interaction, public, member)
+            with Timer(ESSENCE_CMD_SECONDS):
+                await self.essence_cmd(interaction, public, member)
 
         @self.tree.command()
         @app_commands.describe(
@@ -105,125 +219,401 @@ class SaricaBot(discord.Client):
         ):
             await self.add_essence_cmd(interaction, member, points, user_class)
 
+        @self.tree.command()
+        @app_commands.describe(
+            user_class="The class to rank members by. If not provided, members are ranked by level.",
+            public="If true, this command will be visible to everyone.",
+            weekly="If true, rank members by the exp they earned in the last 7 days.",
+        )
+        async def leaderboard(
+            interaction: discord.Interaction,
+            user_class: Optional[UserClass] = None,
+            public: bool = False,
+            weekly: bool = False,
+        ):
+            await self.leaderboard_cmd(interaction, user_class, public, weekly)
+
+        @self.tree.command()
+        async def stats(interaction: discord.Interaction):
+            await self.stats_cmd(interaction)
+
+        @self.tree.command()
+        async def recompute(interaction: discord.Interaction):
+            await self.recompute_cmd(interaction)
+
         @self.tree.command()
         @app_commands.describe(
             no_start="If true, the bot will not restart after reloading.",
+            restart="If true, restart the whole bot even if a hot reload would do.",
         )
-        async def reload(interaction: discord.Interaction, no_start: bool = False):
-            await self.reload_cmd(interaction, no_start)
+        async def reload(
+            interaction: discord.Interaction,
+            no_start: bool = False,
+            restart: bool = False,
+        ):
+            await self.reload_cmd(interaction, no_start, restart)
 
-        self.tree.copy_global_to(guild=self.guild)
-        await self.tree.sync(guild=self.guild)
+        self.http_session = aiohttp.ClientSession()
+        await self.load_guilds()
+        self.mark_startup("load_guilds")
+
+        @self.tree.command()
+        @app_commands.describe(
+            url="The RSS or Atom feed to watch.",
+            channel="The channel to announce new entries in.",
+            role="The role to mention when announcing new entries.",
+        )
+        async def subscribe_feed(
+            interaction: discord.Interaction,
+            url: str,
+            channel: discord.TextChannel,
+            role: Optional[discord.Role] = None,
+        ):
+            await self.subscribe_feed_cmd(interaction, url, channel, role)
 
-        self.update_checker = self.loop.create_task(self.check_for_rr_updates_slow())
+        @self.tree.command()
+        @app_commands.describe(url="The feed to stop watching.")
+        async def unsubscribe_feed(interaction: discord.Interaction, url: str):
+            await self.unsubscribe_feed_cmd(interaction, url)
+
+        @self.tree.command()
+        @app_commands.describe(
+            message_id="The message in this channel members react to.",
+            emoji="The emoji that grants the role.",
+            role="The role to grant.",
+        )
+        async def add_role_menu(
+            interaction: discord.Interaction,
+            message_id: str,
+            emoji: str,
+            role: discord.Role,
+        ):
+            await self.add_role_menu_cmd(interaction, message_id, emoji, role)
+
+        @self.tree.command()
+        @app_commands.describe(
+            message_id="The role menu message.",
+            emoji="The emoji to remove. If not provided, the whole menu is removed.",
+        )
+        async def remove_role_menu(
+            interaction: discord.Interaction,
+            message_id: str,
+            emoji: Optional[str] = None,
+        ):
+            await self.remove_role_menu_cmd(interaction, message_id, emoji)
+
+        @self.tree.command()
+        @app_commands.describe(
+            channel="The channel to backfill. If not provided, every reward channel is backfilled.",
+        )
+        async def backfill(
+            interaction: discord.Interaction,
+            channel: Optional[discord.TextChannel] = None,
+        ):
+            await self.backfill_cmd(interaction, channel)
+
+        for state in self.guild_states.values():
+            await self.sync_commands(state)
+        self.mark_startup("command_sync")
+
+        self.update_checker = self.loop.create_task(self.check_for_feed_updates_slow())
+        self.essence_flusher = self.loop.create_task(self.flush_essences_slow())
+        self.ledger_compactor = self.loop.create_task(self.compact_ledgers_slow())
+        self.lag_monitor = self.loop.create_task(metrics.monitor_loop_lag())
+
+        self.register_metrics()
+        metrics_port = os.getenv("METRICS_PORT")
+        if metrics_port is not None:
+            self.metrics_server = await metrics.start_metrics_server(
+                os.getenv("METRICS_HOST", "127.0.0.1"), int(metrics_port)
+            )
+
+    async def close(self):
+        for state in self.guild_states.values():
+            if state.backfill is not None:
+                state.backfill.cancel()
+            state.awards.close()
+            state.welcomes.close()
+            await state.welcomes.flush()
+            state.role_edits.close()
+            await state.role_edits.flush()
+        await self.outbox.drain(timeout=10)
+        await self.flush_essences()
+        await super().close()
+        if self.http_session is not None:
+            await self.http_session.close()
+            self.http_session = None
+        if self.metrics_server is not None:
+            await self.metrics_server.cleanup()
+            self.metrics_server = None
+        self.db_pool.close()
+
+    async def sync_commands(self, state: GuildState):
+        self.tree.copy_global_to(guild=state.guild)
+
+        # Syncing is slow and rate limited, and the commands rarely change
+        # between restarts, so only sync when their definition differs from
+        # what was last sent for this guild.
+        payload = [
+            c.to_dict(self.tree) for c in self.tree.get_commands(guild=state.guild)
+        ]
+        digest = hashlib.sha256(
+            json.dumps(payload, sort_keys=True).encode("utf-8")
+        ).hexdigest()
+
+        if os.getenv("FORCE_COMMAND_SYNC") is None:
+            if await state.db.get("command_tree_hash") == digest:
+                log.info("Commands for guild %d are up to date", state.config.guild_id)
+                return
+
+        await self.tree.sync(guild=state.guild)
+        await state.db.set("command_tree_hash", digest)
+        log.info("Synced commands for guild %d", state.config.guild_id)
+
+    def register_metrics(self):
+        metrics.CallbackMetric(
+            "sarica_startup_seconds",
+            "Time spent in each startup phase.",
+            ("phase",),
+            lambda: {(phase,): seconds for phase, seconds in self.startup_phases},
+        )
+
+        def cache_requests():
+            values = {}
+            for guild_id, state in self.guild_states.items():
+                values[(guild_id, "essence", "hit")] = state.essences.hits
+                values[(guild_id, "essence", "miss")] = state.essences.misses
+                values[(guild_id, "card", "hit")] = state.cards.hits
+                values[(guild_id, "card", "miss")] = state.cards.misses
+            return values
+
+        def cache_entries():
+            values = {}
+            for guild_id, state in self.guild_states.items():
+                values[(guild_id, "essence")] = len(state.essences.essences)
+                values[(guild_id, "card")] = len(state.cards.cards)
+            return values
+
+        metrics.CallbackMetric(
+            "sarica_cache_requests_total",
+            "Cache lookups by result.",
+            ("guild", "cache", "result"),
+            cache_requests,
+            kind="counter",
+        )
+        metrics.CallbackMetric(
+            "sarica_cache_entries",
+            "Entries held per cache.",
+            ("guild", "cache"),
+            cache_entries,
+        )
+        metrics.CallbackMetric(
+            "sarica_open_databases",
+            "Guild databases currently open.",
+            (),
+            lambda: {(): len(self.db_pool.open)},
+        )
 
     async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
-        if payload.message_id != self.role_message_id:
-            return
+        REACTION_EVENTS.inc()
+        with Timer(ON_REACTION_SECONDS):
+            await self.handle_reaction_add(payload)
 
-        guild = self.get_guild(payload.guild_id)
-        if guild is None:
-            print("Warning: Guild not found", flush=True)
+    async def handle_reaction_add(self, payload: discord.RawReactionActionEvent):
+        # /add_role_menu reacts to the menu itself
+        if payload.user_id == self.user.id:
             return
 
-        essence = self.db.get_essence(payload.member.id)
-        points = 1
-        print(f"{payload.member.name} reacted to a message. Adding {points} exp.", flush=True)
-        essence.add_points(UserClass.Reactionary, points)
-        self.db.set_essence(payload.member.id, essence)
-
-        try:
-            role_id = self.role_mapping[payload.emoji]
-        except KeyError:
-            print(f"Unknown emoji: {payload.emoji}", flush=True)
+        state = self.get_state(payload.guild_id)
+        if state is None or payload.member is None:
             return
 
-        role = guild.get_role(role_id)
-        if role is None:
+        role_id = state.role_menus.route(payload.message_id, payload.emoji)
+        if role_id is None:
             return
 
-        print(f"Adding role {role.name} to {payload.member.name}", flush=True)
-        await payload.member.add_roles(role)
+        points = await state.awards.add(
+            payload.member.id, UserClass.Reactionary, 1, payload.channel_id
+        )
+        if points > 0:
+            awards_log.info(
+                "%s reacted to a message. Adding %d exp.",
+                payload.member.name,
+                points,
+                extra={
+                    "member": payload.member.name,
+                    "member_id": payload.member.id,
+                    "channel": payload.channel_id,
+                    "user_class": UserClass.Reactionary.name,
+                    "points": points,
+                },
+            )
+            CLASS_AWARDS[UserClass.Reactionary].inc()
+            CLASS_AWARD_POINTS[UserClass.Reactionary].inc(points)
+
+        # Role changes are batched per member into a single edit
+        state.role_edits.add(payload.member, role_id, True)
 
     async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
-        if payload.message_id != self.role_message_id:
+        if payload.user_id == self.user.id:
             return
 
-        guild = self.get_guild(payload.guild_id)
-        if guild is None:
-            print("Warning: Guild not found", flush=True)
+        state = self.get_state(payload.guild_id)
+        if state is None:
             return
 
-        try:
-            role_id = self.role_mapping[payload.emoji]
-        except KeyError:
+        role_id = state.role_menus.route(payload.message_id, payload.emoji)
+        if role_id is None:
             return
 
-        role = guild.get_role(role_id)
-        if role is None:
+        guild = self.get_guild(payload.guild_id)
+        if guild is None:
+            log.warning("Guild not found")
             return
 
         member = guild.get_member(payload.user_id)
         if member is None:
             return
 
-        print(f"Removing role {role.name} from {member.name}", flush=True)
-        await member.remove_roles(role)
+        state.role_edits.add(member, role_id, False)
 
-    async def check_for_rr_update(self):
-        chapter = query_rr(self.db)
-        if chapter is None:
-            return
+    async def check_for_feed_updates(self):
+        states = list(self.guild_states.values())
+        with Timer(FEED_UPDATE_SECONDS):
+            updates = await asyncio.gather(*[s.feeds.poll() for s in states])
+
+        for state, entries in zip(states, updates):
+            for sub, entry in entries:
+                try:
+                    await self.announce_entry(state, sub, entry)
+                except Exception:
+                    log.exception("Failed to announce an entry of %s", sub.url)
 
-        print(f"New chapter posted: {chapter.name}", flush=True)
+    async def announce_entry(self, state: GuildState, sub: Subscription, entry):
+        chapter = feed.parse_chapter(entry)
+        title = chapter.name if chapter is not None else entry.get("title")
+        log.info("New feed entry posted: %s", title)
 
-        guild = self.get_guild(self.guild.id)
+        guild = self.get_guild(state.config.guild_id)
         if guild is None:
-            print("Warning: Guild not found", flush=True)
+            log.warning("Guild not found")
             return
 
-        channel = guild.get_channel(self.announcements_channel_id)
-        if channel is None:
-            print("Warning: Announcements channel not found", flush=True)
-            return
+        lines = []
+        if sub.role_id is not None:
+            role = guild.get_role(sub.role_id)
+            if role is None:
+                log.warning("Announcement role for %s not found", sub.url)
+            else:
+                lines.append(role.mention)
+
+        if chapter is not None:
+            lines.append("**Woo!** New chapter! *Ah, yeah!* 🎉🎉🎉")
+            lines.append(f"Chapter {chapter.index} is up: *{chapter.name}*")
+            lines.append(f"[Royal Road]({chapter.link})")
+        else:
+            lines.append("**Woo!** Something new! *Ah, yeah!* 🎉🎉🎉")
+            lines.append(f"[{title}]({entry.get('link')})")
 
-        updates_role = guild.get_role(self.tsqs_updates_role_id)
-        if updates_role is None:
-            print("Warning: TSQS Updates role not found", flush=True)
-            return
+        if sub.footer is not None:
+            lines.append(sub.footer)
 
-        await channel.send(
-            f"""{updates_role.mention}
-**Woo!** New chapter! *Ah, yeah!* 🎉🎉🎉
-Chapter {chapter.index} is up: *{chapter.name}*
-[Royal Road]({chapter.link})
-[Scribble Hub](https://www.scribblehub.com/series/1421176/the-spoken-queens-swarm/)"""
-        )
+        self.outbox.send(sub.channel_id, "\n".join(lines), Lane.Announcement)
 
-    async def check_for_rr_updates_slow(self):
+    async def check_for_feed_updates_slow(self):
         await self.wait_until_ready()
 
-        print("Checking for RR updates every 10 minutes", flush=True)
+        log.info("Checking for feed updates every 10 minutes")
         while not self.is_closed():
-            await self.check_for_rr_update()
+            try:
+                await self.check_for_feed_updates()
+            except Exception:
+                log.exception("Failed to check for feed updates")
 
             now = datetime.now() - timedelta(minutes=1)
             seconds = (now.minute % 10) * 60 + now.second
             to_wait = 600 - seconds
             await asyncio.sleep(to_wait)
 
-    async def bot_spam(self, message):
-        guild = self.get_guild(self.guild.id)
-        if guild is None:
-            print("Warning: Guild not found", flush=True)
-            return
+    async def flush_essences_slow(self):
+        await self.wait_until_ready()
 
-        channel = guild.get_channel(self.bot_spam_channel_id)
-        if channel is None:
-            print("Warning: Bot spam channel not found", flush=True)
-            return
+        while not self.is_closed():
+            await asyncio.sleep(self.essence_flush_interval)
+            await self.flush_essences()
+            try:
+                await self.db_pool.close_idle()
+            except Exception:
+                log.exception("Failed to close idle databases")
+
+    async def compact_ledgers_slow(self):
+        await self.wait_until_ready()
 
-        await channel.send(message)
+        while not self.is_closed():
+            await asyncio.sleep(self.ledger_compact_interval)
+            for state in list(self.guild_states.values()):
+                try:
+                    folded, pruned = await state.db.compact(
+                        self.ledger_retention, self.rollup_retention
+                    )
+                except Exception:
+                    log.exception(
+                        "Failed to compact the ledger for guild %d",
+                        state.config.guild_id,
+                    )
+                    continue
+
+                log.info(
+                    "Compacted the ledger for guild %d: %d entries folded, %d pruned",
+                    state.config.guild_id,
+                    folded,
+                    pruned,
+                )
+
+    async def flush_essences(self):
+        # A failed write keeps its points pending, so one guild's database
+        # error only delays its flush until the next one
+        for state in list(self.guild_states.values()):
+            try:
+                await state.awards.flush()
+                await state.essences.flush()
+            except Exception:
+                log.exception(
+                    "Failed to flush Essence for guild %d", state.config.guild_id
+                )
+
+    async def check_admin(self, interaction: discord.Interaction) -> bool:
+        if interaction.permissions.administrator:
+            return True
+
+        await interaction.response.send_message(
+            f"Sorry, {interaction.user.name}, I can't do that. You do not have permission to use this command.",
+            ephemeral=True,
+        )
+        return False
+
+    async def interaction_state(
+        self, interaction: discord.Interaction
+    ) -> Optional[GuildState]:
+        state = self.get_state(interaction.guild_id)
+        if state is None:
+            await interaction.response.send_message(
+                "I'm not set up for this server.", ephemeral=True
+            )
+        return state
+
+    async def admin_state(
+        self, interaction: discord.Interaction
+    ) -> Optional[GuildState]:
+        # Both checks answer the interaction when they fail
+        if not await self.check_admin(interaction):
+            return None
+        return await self.interaction_state(interaction)
+
+    def bot_spam(self, state: GuildState, message):
+        self.outbox.send(
+            state.config.bot_spam_channel_id, message, Lane.Bot_Spam, coalesce=True
+        )
 
     async def add_essence_cmd(
         self,
@@ -232,17 +622,25 @@ Chapter {chapter.index} is up: *{chapter.name}*
         points: int,
         user_class: UserClass,
     ):
-        if not interaction.permissions.administrator:
-            await interaction.response.send_message(
-                "Sorry, {interaction.user.name}, I can't do that. You do not have permission to use this command.",
-                ephemeral=True,
-            )
+        state = await self.admin_state(interaction)
+        if state is None:
             return
 
-        essence = self.db.get_essence(member.id)
-        print(f"{member.name} gained {points} {user_class.get_name()} exp.", flush=True)
-        essence.add_points(user_class, points)
-        self.db.set_essence(member.id, essence)
+        awards_log.info(
+            "%s gained %d %s exp.",
+            member.name,
+            points,
+            user_class.get_name(),
+            extra={
+                "member": member.name,
+                "member_id": member.id,
+                "user_class": user_class.name,
+                "points": points,
+            },
+        )
+        await state.essences.add_points(
+            member.id, user_class, points, interaction.channel_id
+        )
 
         await interaction.response.send_message(
             f"{member.name} gained {points} exp in {user_class.get_name()}.",
@@ -255,253 +653,464 @@ Chapter {chapter.index} is up: *{chapter.name}*
         public: bool,
         member: Optional[discord.Member],
     ):
+        state = await self.interaction_state(interaction)
+        if state is None:
+            return
+
         if member is None:
             member = interaction.user
 
-        essence = self.db.get_essence(member.id)
-        level = f"{str(essence.get_level())} ({essence.get_exp_percent_str()})"
-        realm = essence.get_realm()
-        stage = essence.get_stage()
-        path = essence.get_path().name
+        await state.awards.flush_member(member.id)
+        essence = await state.essences.get(member.id)
+        rendered = state.cards.get(member.id, essence.version)
+        if rendered is None:
+            rendered = card.render_essence_card(essence)
+            state.cards.put(member.id, essence.version, rendered)
 
-        if realm.has_progress():
-            progress = essence.get_realm_progress().name
-            realm = f"{realm.name} Realm ({progress})"
-        else:
-            realm = realm.name
+        await interaction.response.send_message(rendered, ephemeral=not public)
 
-        if stage.has_steps():
-            suffix = ["st", "nd", "rd", "th"]
-            step = essence.get_step()
-            suffix = suffix[step - 1] if step < 4 else suffix[3]
-            stage = f"{stage.name} Stage ({step}{suffix} Step)"
+    async def leaderboard_cmd(
+        self,
+        interaction: discord.Interaction,
+        user_class: Optional[UserClass],
+        public: bool,
+        weekly: bool = False,
+    ):
+        state = await self.interaction_state(interaction)
+        if state is None:
+            return
+
+        if weekly:
+            # Earnings are summed from the ledger rollups, so write out
+            # whatever is still pending first
+            await state.awards.flush()
+            await state.essences.flush()
+            top = await state.db.get_top_members_since(
+                time.time() - WEEK_SECONDS, user_class, state.leaderboard.size
+            )
         else:
-            stage = stage.name
+            top = await state.leaderboard.top(user_class)
 
-        levels = [["Level", level], ["Realm", realm], ["Stage", stage], ["Path", path]]
-        class_header = ["Class", "Alignment", "Affinity"]
-        classes = []
+        guild = interaction.guild
+        rows = []
 
-        for class_progress in essence.get_class_list():
-            name = class_progress.user_class.get_name()
-            alignment = class_progress.user_class.get_alignment().name
-            affinity = class_progress.get_grade()
+        for rank, (member_id, score) in enumerate(top, start=1):
+            member = guild.get_member(member_id) if guild is not None else None
+            name = member.display_name if member is not None else "Unknown"
 
-            if affinity == "X":
-                continue
+            if user_class is None and not weekly:
+                score = get_level_for_exp(score)
 
-            classes.append([name, alignment, affinity])
+            rows.append([str(rank), name, str(score)])
+
+        if len(rows) == 0:
+            rows.append(["-", "-", "-"])
+
+        if user_class is None:
+            title = "Leaderboard"
+            header = ["Rank", "Member", "Exp" if weekly else "Level"]
+        else:
+            title = f"{user_class.get_name()} Leaderboard"
+            header = ["Rank", "Member", "Points"]
 
-        if len(classes) == 0:
-            classes.append(["-", "-", "-"])
+        if weekly:
+            title = f"Weekly {title}"
 
         await interaction.response.send_message(
-            f"""
-            ```{make_table(levels)}\n{make_table(classes, class_header)}```
-            """,
+            f"**{title}**\n```{table.make_table(rows, header)}```",
             ephemeral=not public,
         )
 
-    async def reload_cmd(self, interaction: discord.Interaction, no_start: bool):
-        if not interaction.permissions.administrator:
+    async def subscribe_feed_cmd(
+        self,
+        interaction: discord.Interaction,
+        url: str,
+        channel: discord.TextChannel,
+        role: Optional[discord.Role],
+    ):
+        state = await self.admin_state(interaction)
+        if state is None:
+            return
+
+        role_id = role.id if role is not None else None
+        sub = await state.feeds.subscribe(url, channel.id, role_id)
+        if sub is None:
+            await interaction.response.send_message(
+                f"I'm already watching {url}.", ephemeral=True
+            )
+            return
+
+        log.info("Subscribed to feed %s in %s", url, channel.name)
+        await interaction.response.send_message(
+            f"Got it, I'll post new entries from {url} in {channel.mention}.",
+            ephemeral=True,
+        )
+
+    async def unsubscribe_feed_cmd(self, interaction: discord.Interaction, url: str):
+        state = await self.admin_state(interaction)
+        if state is None:
+            return
+
+        if not await state.feeds.unsubscribe(url):
+            await interaction.response.send_message(
+                f"I'm not watching {url}.", ephemeral=True
+            )
+            return
+
+        log.info("Unsubscribed from feed %s", url)
+        await interaction.response.send_message(
+            f"Okay, I'll stop watching {url}.", ephemeral=True
+        )
+
+    async def add_role_menu_cmd(
+        self,
+        interaction: discord.Interaction,
+        message_id: str,
+        emoji: str,
+        role: discord.Role,
+    ):
+        state = await self.admin_state(interaction)
+        if state is None:
+            return
+
+        if not message_id.isdigit():
+            await interaction.response.send_message(
+                f"{message_id} is not a message ID.", ephemeral=True
+            )
+            return
+
+        try:
+            message = await interaction.channel.fetch_message(int(message_id))
+        except discord.HTTPException:
             await interaction.response.send_message(
-                "Sorry, {interaction.user.name}, I can't do that. You do not have permission to use this command.",
+                f"I couldn't find message {message_id} in this channel.",
                 ephemeral=True,
             )
             return
 
-        await interaction.response.send_message("You got it, boss.", ephemeral=True)
+        partial = discord.PartialEmoji.from_str(emoji.strip())
+        try:
+            await message.add_reaction(partial)
+        except discord.HTTPException:
+            await interaction.response.send_message(
+                f"I can't react with {emoji}.", ephemeral=True
+            )
+            return
 
-        if no_start:
-            await self.bot_spam("Oh, gotta go for a second. Be back soon!")
-            sys.exit(1)
+        await state.role_menus.add(message.id, partial, role.id)
+        log.info("Added %s for role %s to role menu %d", emoji, role.name, message.id)
+        await interaction.response.send_message(
+            f"Got it, reacting with {emoji} now grants {role.mention}.",
+            ephemeral=True,
+        )
+
+    async def remove_role_menu_cmd(
+        self,
+        interaction: discord.Interaction,
+        message_id: str,
+        emoji: Optional[str],
+    ):
+        state = await self.admin_state(interaction)
+        if state is None:
+            return
+
+        if not message_id.isdigit():
+            await interaction.response.send_message(
+                f"{message_id} is not a message ID.", ephemeral=True
+            )
+            return
+
+        partial = discord.PartialEmoji.from_str(emoji.strip()) if emoji else None
+        if await state.role_menus.remove(int(message_id), partial) == 0:
+            await interaction.response.send_message(
+                "There is no such role menu entry.", ephemeral=True
+            )
+            return
+
+        log.info("Removed role menu entries from message %s", message_id)
+        await interaction.response.send_message(
+            "Okay, those reactions no longer grant roles.", ephemeral=True
+        )
+
+    async def backfill_cmd(
+        self, interaction: discord.Interaction, channel: Optional[discord.TextChannel]
+    ):
+        state = await self.admin_state(interaction)
+        if state is None:
+            return
+
+        if state.backfill is not None:
+            await interaction.response.send_message(
+                "A backfill is already running.", ephemeral=True
+            )
+            return
+
+        if channel is not None:
+            channels = [channel]
         else:
-            await self.bot_spam("Restarting. I'll be back in a moment.")
-            sys.exit(0)
+            channels = []
+            for channel_id in state.config.reward_rules:
+                found = interaction.guild.get_channel(channel_id)
+                if found is not None:
+                    channels.append(found)
 
-    async def on_message(self, message: discord.Message):
-        if message.author.id == self.user.id:
+        if len(channels) == 0:
+            await interaction.response.send_message(
+                "There are no reward channels to backfill.", ephemeral=True
+            )
             return
 
-        essence = self.db.get_essence(message.author.id)
+        # Reading history takes a while, so it runs in the background and
+        # reports to bot spam when it is done.
+        state.backfill = self.loop.create_task(self.run_backfill(state, channels))
+        names = ", ".join(c.mention for c in channels)
+        await interaction.response.send_message(
+            f"Backfilling Essence from {names}.", ephemeral=True
+        )
 
-        print(f"{message.author.name} posted a message. Adding 1 exp.", flush=True)
-        essence.add_points(UserClass.Social_Butterfly, 1)
+    async def run_backfill(self, state: GuildState, channels):
+        tracked_since = None
+        guild = self.get_guild(state.config.guild_id)
+        if guild is not None and guild.me.joined_at is not None:
+            tracked_since = guild.me.joined_at.timestamp()
+
+        backfill = Backfill(
+            state,
+            self.user.id,
+            batch_size=int(os.getenv("BACKFILL_BATCH_SIZE", "2000")),
+            tracked_since=tracked_since,
+        )
+        started = time.perf_counter()
+        try:
+            await backfill.run(channels)
+        except Exception:
+            log.exception("Backfill failed")
+            self.bot_spam(state, "Backfill failed, run it again to resume.")
+            return
+        finally:
+            state.backfill = None
+
+        elapsed = time.perf_counter() - started
+        self.bot_spam(
+            state,
+            f"Backfilled {backfill.scanned} messages in {elapsed:.0f} s: "
+            f"{backfill.points} exp from {backfill.awarded} messages, "
+            f"{backfill.skipped} already counted.",
+        )
 
-        stickers = len(message.stickers)
-        if stickers > 0:
-            points = stickers * 5
-            print(f"{message.author.name} posted a sticker. Adding {points} exp.", flush=True)
-            essence.add_points(UserClass.Sticker_Collector, points)
+    async def recompute_cmd(self, interaction: discord.Interaction):
+        state = await self.admin_state(interaction)
+        if state is None:
+            return
 
-        if message.channel.id == self.memes_channel_id:
-            points = len(message.attachments) * 100
-            if message.content is not None and len(message.content) > 0:
-                points += 1
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        started = time.perf_counter()
+
+        # Everything awarded so far goes into the snapshot being recomputed,
+        # afterwards cached members, cards and rankings are read again
+        await state.awards.flush()
+        await state.essences.flush()
+        recomputed = await state.db.recompute_essences()
+        await state.essences.reset()
+        state.cards.cards.clear()
+        await state.leaderboard.load()
+
+        elapsed = (time.perf_counter() - started) * 1000
+        log.info(
+            "Recomputed %d members in %.0f ms, %d rewritten",
+            len(recomputed),
+            elapsed,
+            recomputed.written,
+        )
 
-            print(f"{message.author.name} posted a meme. Adding {points} exp.", flush=True)
-            essence.add_points(UserClass.Jester, points)
+        realms = table.make_table(
+            [[realm.name, str(count)] for realm, count in recomputed.count_realms()],
+            ["Realm", "Members"],
+        )
+        grades = table.make_table(
+            [[grade, str(count)] for grade, count in recomputed.count_top_grades()],
+            ["Top Grade", "Members"],
+        )
+        await interaction.followup.send(
+            f"Recomputed {len(recomputed)} members in {elapsed:.0f} ms, "
+            f"{recomputed.written} rewritten and {recomputed.level_changes} "
+            f"changed level.\n```{realms}\n{grades}```",
+            ephemeral=True,
+        )
 
-        if message.channel.id == self.new_members_channel_id:
-            join_cutoff = datetime.now() - timedelta(days=1)
-            points = 0
+    async def stats_cmd(self, interaction: discord.Interaction):
+        if not await self.check_admin(interaction):
+            return
 
-            for mention in message.mentions:
-                if mention.joined_at is None:
-                    continue
+        def ms(value):
+            return "-" if value is None else f"{value * 1000:.1f}"
+
+        timings = []
+        for histogram in [metrics.HANDLER_SECONDS, metrics.DB_SECONDS]:
+            for (name,), child in sorted(histogram.children.items()):
+                timings.append(
+                    [
+                        name,
+                        str(child.count),
+                        ms(child.quantile(0.5)),
+                        ms(child.quantile(0.99)),
+                    ]
+                )
+
+        if len(timings) == 0:
+            timings.append(["-", "-", "-", "-"])
+
+        def rate(hits, misses):
+            total = hits + misses
+            return "-" if total == 0 else f"{hits / total * 100:.1f}%"
+
+        lag = metrics.LOOP_LAG.labels()
+        summary = []
+        state = self.get_state(interaction.guild_id)
+        if state is not None:
+            essences = state.essences
+            cards = state.cards
+            summary.append(["Essence cache", rate(essences.hits, essences.misses)])
+            summary.append(["Card cache", rate(cards.hits, cards.misses)])
+            summary.append(["Awards collapsed", str(state.awards.collapsed)])
+            summary.append(["Role edits", str(state.role_edits.edits)])
+
+        summary.append(["Open databases", str(len(self.db_pool.open))])
+        summary.append(["Loop lag p99 (ms)", ms(lag.quantile(0.99))])
+
+        timing_header = ["Operation", "Count", "p50 (ms)", "p99 (ms)"]
+        await interaction.response.send_message(
+            f"```{table.make_table(summary)}\n{table.make_table(timings, timing_header)}```",
+            ephemeral=True,
+        )
 
-                if mention.joined_at > join_cutoff:
-                    continue
+    async def reload_cmd(
+        self, interaction: discord.Interaction, no_start: bool, restart: bool
+    ):
+        if not await self.check_admin(interaction):
+            return
 
-                points += 100
+        changed = self.reloader.changed()
+        if not no_start and not restart and not self.reloader.needs_restart(changed):
+            await self.hot_reload(interaction, changed)
+            return
 
-            if points > 0:
-                print(
-                    f"{message.author.name} has greeted a new user(s). Adding {points} exp."
-                , flush=True)
-                essence.add_points(UserClass.Friendly_Guide, points)
+        await interaction.response.send_message("You got it, boss.", ephemeral=True)
+        await self.flush_essences()
+
+        for state in self.guild_states.values():
+            if no_start:
+                self.bot_spam(state, "Oh, gotta go for a second. Be back soon!")
+            else:
+                self.bot_spam(state, "Restarting. I'll be back in a moment.")
+
+        await self.outbox.drain(timeout=10)
+        sys.exit(1 if no_start else 0)
+
+    async def hot_reload(self, interaction: discord.Interaction, changed):
+        # Flushing, adding guilds and syncing their commands can take longer
+        # than Discord waits for a response
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        started = time.perf_counter()
+        await self.flush_essences()
+
+        # Nothing below awaits until every module, config and live object has
+        # been swapped, so no handler ever sees a mix of old and new code.
+        try:
+            reloaded = self.reloader.reload(changed)
+            configs = guilds.get_guild_configs()
+        except Exception as e:
+            # Module code and config files can fail in any way, keep running
+            # on what is loaded rather than taking the bot down.
+            log.exception("Hot reload failed")
+            await interaction.followup.send(f"Couldn't reload: {e}", ephemeral=True)
+            return
 
-        if message.channel.id == self.cute_pics_channel_id:
-            points = len(message.attachments) * 100
-            if message.content is not None and len(message.content) > 0:
-                points += 1
+        # Live state is kept in modules that are never hot reloaded, so only
+        # the config is swapped here
+        self.guild_configs = configs
+        for guild_id, state in self.guild_states.items():
+            # Cards may render differently now, drop the old ones
+            state.cards.cards.clear()
+
+            config = configs.get(guild_id)
+            if config is not None:
+                state.config = config
+
+        for guild_id in list(self.guild_states):
+            if guild_id not in configs:
+                log.info("Guild %d was removed from the config", guild_id)
+                state = self.guild_states.pop(guild_id)
+                if state.backfill is not None:
+                    state.backfill.cancel()
+                state.welcomes.close()
+                await state.welcomes.flush()
+                state.awards.close()
+                state.role_edits.close()
+                await state.role_edits.flush()
+                await state.awards.flush()
+                await state.essences.flush()
+
+        for guild_id, config in configs.items():
+            if guild_id not in self.guild_states:
+                log.info("Guild %d was added to the config", guild_id)
+                await self.sync_commands(await self.add_guild(config))
+
+        elapsed = (time.perf_counter() - started) * 1000
+        modules = ", ".join(reloaded) if len(reloaded) > 0 else "no modules"
+        await interaction.followup.send(
+            f"Reloaded {modules} and the guild config in {elapsed:.0f} ms.",
+            ephemeral=True,
+        )
 
-            print(f"{message.author.name} posted a cute pic. Adding {points} exp.", flush=True)
-            essence.add_points(UserClass.Soul_Healer, points)
+    async def on_message(self, message: discord.Message):
+        MESSAGE_EVENTS.inc()
+        with Timer(ON_MESSAGE_SECONDS):
+            await self.handle_message(message)
 
-        if message.channel.id == self.nsfw_channel_id:
-            points = len(message.attachments) * 100
-            if message.content is not None and len(message.content) > 0:
-                points += 1
+    async def handle_message(self, message: discord.Message):
+        if message.author.id == self.user.id or message.guild is None:
+            return
 
-            print(f"{message.author.name} posted a NSFW pic. Adding {points} exp.", flush=True)
-            essence.add_points(UserClass.Deviant, points)
+        state = self.get_state(message.guild.id)
+        if state is None:
+            return
 
-        if (
-            message.channel.id == self.tsqs_channel_id
-            or message.channel.id == self.tsqs_spoiler_channel_id
-        ):
-            points = 10
-            print(f"{message.author.name} talked about TSQS. Adding {points} exp.", flush=True)
-            essence.add_points(UserClass.Bug_Girl_Connoisseur, points)
-
-            points = 1
-            print(f"{message.author.name} talked about a book. Adding {points} exp.", flush=True)
-            essence.add_points(UserClass.Reader, points)
-
-        if message.channel.id == self.suggestions_channel_id:
-            points = 10
-            print(f"{message.author.name} made a suggestion. Adding {points} exp.", flush=True)
-            essence.add_points(UserClass.Visionary, points)
-
-        if message.channel.id == self.theorycrafting_channel_id:
-            points = 10
-            print(f"{message.author.name} theorycrafted. Adding {points} exp.", flush=True)
-            essence.add_points(UserClass.Conspiracy_Theorist, points)
-
-        if message.channel.id == self.q_and_a_channel_id:
-            points = 10
-            print(f"{message.author.name} asked a question. Adding {points} exp.", flush=True)
-            essence.add_points(UserClass.Researcher, points)
-
-        if message.channel.id == self.server_discussion_channel_id:
-            points = 10
-            print(
-                f"{message.author.name} discussed meta server topics. Adding {points} exp."
-            , flush=True)
-            essence.add_points(UserClass.Tech_Support, points)
-
-        if message.channel.id == self.bot_spam_channel_id:
-            points = 1
-            print(f"{message.author.name} talked in bot spam. Adding {points} exp.", flush=True)
-            essence.add_points(UserClass.Tech_Support, points)
-
-        if message.channel.id == self.cool_stuff_channel_id:
-            points = len(message.attachments) * 100
-            if message.content is not None and len(message.content) > 0:
-                points += 1
-
-            print(f"{message.author.name} posted something cool. Adding {points} exp.", flush=True)
-            essence.add_points(UserClass.Web_Archiver, points)
-
-        if message.channel.id == self.show_off_channel_id:
-            if (
-                message.thread is not None
-                and message.thread.owner_id == message.author.id
-            ):
-                points = len(message.attachments) * 1000
-                if message.content is not None and len(message.content) > 0:
-                    points += 1
-
-                print(f"{message.author.name} showed off. Adding {points} exp.", flush=True)
-                essence.add_points(UserClass.Content_Creator, points)
-
-        if message.channel.id == self.intro_channel_id:
-            points = 50
-
-            join_cutoff = datetime.now() - timedelta(days=3)
-            if (
-                message.author.joined_at is not None
-                and message.author.joined_at >= join_cutoff
-            ):
-                points = 500
-
-            print(f"{message.author.name} introduced themselves. Adding {points} exp.", flush=True)
-            essence.add_points(UserClass.Social_Butterfly, points)
-
-        if message.channel.id == self.fan_art_channel_id:
-            if (
-                message.thread is not None
-                and message.thread.owner_id == message.author.id
-            ):
-                points = len(message.attachments) * 1000
-                if message.content is not None and len(message.content) > 0:
-                    points += 1
-
-                print(f"{message.author.name} posted fan art. Adding {points} exp.", flush=True)
-                essence.add_points(UserClass.Artist, points)
-
-                print(f"{message.author.name} showed off. Adding {points} exp.", flush=True)
-                essence.add_points(UserClass.Content_Creator, points)
-
-        if message.channel.id == self.fan_games_channel_id:
-            if (
-                message.thread is not None
-                and message.thread.owner_id == message.author.id
-            ):
-                points = len(message.attachments) * 1000
-                if message.content is not None and len(message.content) > 0:
-                    points += 1
-
-                print(f"{message.author.name} posted a fan game. Adding {points} exp.", flush=True)
-                essence.add_points(UserClass.GameDev, points)
-
-                print(f"{message.author.name} showed off. Adding {points} exp.", flush=True)
-                essence.add_points(UserClass.Content_Creator, points)
-
-        if message.channel.id == self.fan_books_channel_id:
-            if (
-                message.thread is not None
-                and message.thread.owner_id == message.author.id
-            ):
-                points = len(message.attachments) * 1000
-                if message.content is not None and len(message.content) > 0:
-                    points += 1
-
-                print(f"{message.author.name} posted a fan book. Adding {points} exp.", flush=True)
-                essence.add_points(UserClass.Storyteller, points)
-
-                print(f"{message.author.name} showed off. Adding {points} exp.", flush=True)
-                essence.add_points(UserClass.Content_Creator, points)
-
-        if message.channel.id == self.book_discussion_channel_id:
-            points = 10
-            print(f"{message.author.name} discussed a book. Adding {points} exp.", flush=True)
-            essence.add_points(UserClass.Reader, points)
-
-        self.db.set_essence(message.author.id, essence)
-
-
-def run():
-    client = SaricaBot()
-    client.run(os.getenv("DISCORD_TOKEN"))
+        awards = rewards.get_message_awards(message, state.config.reward_rules)
+
+        # Awards are collected per member and class and applied in one go
+        # once the award window closes, the rate cap may withhold some points.
+        granted = []
+        for user_class, points, reason in awards:
+            points = await state.awards.add(
+                message.author.id, user_class, points, message.channel.id
+            )
+            if points <= 0:
+                continue
+
+            granted.append((user_class, points, reason))
+            CLASS_AWARDS[user_class].inc()
+            CLASS_AWARD_POINTS[user_class].inc(points)
+
+        # One record per message rather than one line per award
+        if len(granted) > 0 and awards_log.isEnabledFor(logging.INFO):
+            awards_log.info(
+                "%s earned %d exp.",
+                message.author.name,
+                sum(points for _, points, _ in granted),
+                extra={
+                    "member": message.author.name,
+                    "member_id": message.author.id,
+                    "channel": message.channel.id,
+                    "awards": [
+                        {"class": c.name, "points": p, "reason": r}
+                        for c, p, r in granted
+                    ],
+                },
+            )
+
+
+def run(started: Optional[float] = None):
+    setup_logging()
+    client = SaricaBot(started)
+    client.run(os.getenv("DISCORD_TOKEN"), log_handler=None)
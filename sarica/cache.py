@@ -0,0 +1,185 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Optional
+from .essence import Essence, UserClass
+from .sql import Database
+
+
+log = logging.getLogger(__name__)
+
+
+class EssenceCache:
+    def __init__(self, db: Database, max_size: int = 1024, flush_threshold: int = 64):
+        self.db = db
+        self.max_size = max_size
+        self.flush_threshold = flush_threshold
+        self.essences = OrderedDict()
+        self.dirty = set()
+        # Ledger entries for the points added to dirty members
+        self.entries = []
+        self.loading = {}
+        # member id -> bulk write that must land before the member is loaded
+        self.barriers = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, member_id) -> Essence:
+        essence = self.essences.get(member_id)
+        if essence is not None:
+            self.essences.move_to_end(member_id)
+            self.hits += 1
+            return essence
+
+        self.misses += 1
+
+        # Share a single load between handlers that miss on the same member,
+        # otherwise the second load would replace the first one's changes.
+        task = self.loading.get(member_id)
+        if task is not None:
+            return await task
+
+        task = asyncio.ensure_future(self.load(member_id))
+        self.loading[member_id] = task
+        try:
+            essence = await task
+        finally:
+            del self.loading[member_id]
+
+        self.essences[member_id] = essence
+        await self.evict()
+        return essence
+
+    async def load(self, member_id) -> Essence:
+        barrier = self.barriers.get(member_id)
+        if barrier is not None:
+            await asyncio.wait([barrier])
+
+        return await self.db.get_essence(member_id)
+
+    async def apply_deltas(self, deltas, config=None, channel_id=None) -> None:
+        # Deltas are {member_id: {(UserClass, time): points}}, the time being
+        # when the points were earned. Members already in memory take their
+        # points there, everyone else is read from the database without
+        # filling the cache. Both are written to the ledger together with the
+        # config keys in one transaction.
+        cached = []
+        uncached = {}
+        for member_id, points in deltas.items():
+            if member_id in self.essences or member_id in self.loading:
+                cached.append(member_id)
+            else:
+                uncached[member_id] = points
+
+        barrier = asyncio.get_running_loop().create_future()
+        for member_id in uncached:
+            self.barriers[member_id] = barrier
+
+        try:
+            entries = []
+            essences = []
+            for member_id in cached:
+                essence = await self.get(member_id)
+                for (user_class, when), amount in deltas[member_id].items():
+                    essence.add_points(user_class, amount)
+                    entries.append(
+                        (when, member_id, user_class.value, amount, channel_id)
+                    )
+                essences.append((member_id, essence))
+
+            await self.db.add_points_bulk(
+                uncached, entries, essences, config, channel_id
+            )
+        finally:
+            barrier.set_result(None)
+            for member_id in uncached:
+                if self.barriers.get(member_id) is barrier:
+                    del self.barriers[member_id]
+
+    async def add_points(
+        self, member_id, user_class: UserClass, points: int, channel_id=None
+    ) -> Essence:
+        essence = await self.get(member_id)
+        essence.add_points(user_class, points)
+        self.entries.append(
+            (time.time(), member_id, user_class.value, points, channel_id)
+        )
+
+        self.dirty.add(member_id)
+        if len(self.dirty) >= self.flush_threshold:
+            # The points stay pending if this fails, so the award still counts
+            try:
+                await self.flush()
+            except Exception:
+                log.exception("Failed to flush Essence")
+
+        return essence
+
+    async def reset(self) -> None:
+        # Drops every cached Essence so they are read again, writing anything
+        # pending first. Nothing may be loading or dirty when the cache is
+        # cleared, or an old Essence would come back.
+        while len(self.loading) > 0 or len(self.entries) > 0:
+            if len(self.entries) > 0:
+                await self.flush()
+            else:
+                await asyncio.wait(list(self.loading.values()))
+
+        self.essences.clear()
+        self.dirty.clear()
+
+    async def evict(self) -> None:
+        while len(self.essences) > self.max_size:
+            member_id = next(iter(self.essences))
+
+            # Never drop unsaved progress, write everything pending first
+            if member_id in self.dirty:
+                await self.flush()
+                continue
+
+            self.essences.popitem(last=False)
+
+    async def flush(self) -> None:
+        if len(self.entries) == 0:
+            return
+
+        dirty = self.dirty
+        essences = [(m, self.essences[m]) for m in dirty]
+        entries = self.entries
+        self.dirty = set()
+        self.entries = []
+
+        try:
+            await self.db.write_ledger(entries, essences)
+        except Exception:
+            # Keep the points and the members pinned in the cache, the next
+            # flush writes them together with anything added meanwhile
+            self.entries = entries + self.entries
+            self.dirty |= dirty
+            raise
+
+
+class CardCache:
+    def __init__(self, max_size: int = 256):
+        self.max_size = max_size
+        self.cards = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, member_id, version) -> Optional[str]:
+        entry = self.cards.get(member_id)
+        if entry is None or entry[0] != version:
+            self.misses += 1
+            return None
+
+        self.cards.move_to_end(member_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, member_id, version, card: str) -> None:
+        self.cards[member_id] = (version, card)
+        self.cards.move_to_end(member_id)
+
+        while len(self.cards) > self.max_size:
+            self.cards.popitem(last=False)
@@ -0,0 +1,44 @@
+from .essence import Essence
+from .table import make_table
+
+
+def render_essence_card(essence: Essence) -> str:
+    level = f"{str(essence.get_level())} ({essence.get_exp_percent_str()})"
+    realm = essence.get_realm()
+    stage = essence.get_stage()
+    path = essence.get_path().name
+
+    if realm.has_progress():
+        progress = essence.get_realm_progress().name
+        realm = f"{realm.name} Realm ({progress})"
+    else:
+        realm = realm.name
+
+    if stage.has_steps():
+        suffix = ["st", "nd", "rd", "th"]
+        step = essence.get_step()
+        suffix = suffix[step - 1] if step < 4 else suffix[3]
+        stage = f"{stage.name} Stage ({step}{suffix} Step)"
+    else:
+        stage = stage.name
+
+    levels = [["Level", level], ["Realm", realm], ["Stage", stage], ["Path", path]]
+    class_header = ["Class", "Alignment", "Affinity"]
+    classes = []
+
+    for class_progress in essence.get_class_list():
+        name = class_progress.user_class.get_name()
+        alignment = class_progress.user_class.get_alignment().name
+        affinity = class_progress.get_grade()
+
+        if affinity == "X":
+            continue
+
+        classes.append([name, alignment, affinity])
+
+    if len(classes) == 0:
+        classes.append(["-", "-", "-"])
+
+    return f"""
+            ```{make_table(levels)}\n{make_table(classes, class_header)}```
+            """
@@ -1,4 +1,7 @@
 import math
+import itertools
+from array import array
+from bisect import bisect_right
 from typing import List, Tuple
 from enum import Enum
 
@@ -95,7 +98,7 @@ class Stage(Enum):
     Unity = 23
 
     # Transcendent
-    Omniscience = 23
+    Omniscience = 24
     Omnipresence = 25
     Omnipotence = 26
 
@@ -152,13 +155,79 @@ class UserClass(Enum):
         return Alignment.Primordial
 
 
+MAX_LEVEL = 244
+
+
+def exp_for_level(level: int) -> int:
+    return math.floor(math.pow(10 * (level + 1), 1.5) * 3)
+
+
+# EXP_TO_NEXT[level] is the exp needed to leave a level, TOTAL_EXP[level] is
+# the exp needed to reach it from level 0. TOTAL_EXP also holds the entry for
+# MAX_LEVEL + 1 so bisecting it can detect when a gain overshoots the cap.
+EXP_TO_NEXT = [exp_for_level(level) for level in range(MAX_LEVEL + 2)]
+TOTAL_EXP = [0]
+for needed in EXP_TO_NEXT:
+    TOTAL_EXP.append(TOTAL_EXP[-1] + needed)
+TOTAL_EXP.pop()
+
+LEVEL_REALMS = [Realm((level - 1) // 27) for level in range(MAX_LEVEL + 1)]
+LEVEL_REALM_PROGRESS = [
+    RealmProgress(((level - 1) // 9) % 3) for level in range(MAX_LEVEL + 1)
+]
+LEVEL_STAGES = [Stage((level - 1) // 9) for level in range(MAX_LEVEL + 1)]
+LEVEL_STEPS = [((level - 1) % 9) + 1 for level in range(MAX_LEVEL + 1)]
+LEVEL_PATHS = [Path((level - 1) // 81) for level in range(MAX_LEVEL + 1)]
+
+
+CLASS_COUNT = len(UserClass)
+USER_CLASSES = sorted(UserClass, key=lambda c: c.value)
+
+# Every change to any Essence takes a new version from this counter, so a
+# version identifies one exact state even across cache evictions and reloads.
+VERSIONS = itertools.count()
+
+# Per-class flags stored in Essence.flags
+CLASS_PRESENT = 1
+CLASS_CHANGED = 2
+
+
 class ClassProgress:
+    __slots__ = ("essence", "user_class")
 
-    def __init__(self, user_class: UserClass):
+    def __init__(self, essence: "Essence", user_class: UserClass):
+        self.essence = essence
         self.user_class = user_class
-        self.affinity = 0
-        self.points = 0
-        self.changed = False
+
+    @property
+    def points(self) -> int:
+        return self.essence.points[self.user_class.value]
+
+    @points.setter
+    def points(self, value: int) -> None:
+        self.essence.points[self.user_class.value] = value
+        self.essence.stale = True
+        self.essence.version = next(VERSIONS)
+
+    @property
+    def affinity(self) -> float:
+        self.essence.update_affinities()
+        return self.essence.affinities[self.user_class.value]
+
+    @affinity.setter
+    def affinity(self, value: float) -> None:
+        self.essence.affinities[self.user_class.value] = value
+
+    @property
+    def changed(self) -> bool:
+        return self.essence.flags[self.user_class.value] & CLASS_CHANGED != 0
+
+    @changed.setter
+    def changed(self, value: bool) -> None:
+        if value:
+            self.essence.flags[self.user_class.value] |= CLASS_CHANGED
+        else:
+            self.essence.flags[self.user_class.value] &= ~CLASS_CHANGED
 
     def get_grade(self) -> str:
         return affinity_to_grade(self.affinity)
@@ -169,25 +238,77 @@ class ClassProgress:
 
 
 class Essence:
+    __slots__ = (
+        "exp",
+        "level",
+        "changed",
+        "points",
+        "affinities",
+        "flags",
+        "order",
+        "stale",
+        "version",
+    )
+
     def __init__(self):
         self.exp = 0
         self.level = 0
-        self.classes = []
+        self.changed = False
+
+        # Indexed by UserClass.value. ClassProgress objects are only views
+        # onto these arrays, created when a class is looked up. Affinities and
+        # the order of classes are recomputed when read after points change.
+        self.points = array("q", bytes(8 * CLASS_COUNT))
+        self.affinities = array("d", bytes(8 * CLASS_COUNT))
+        self.flags = array("B", bytes(CLASS_COUNT))
+        self.order = array("B")
+        self.stale = False
+        self.version = next(VERSIONS)
 
     def get_class(self, user_class: UserClass, append=True) -> ClassProgress:
-        for c in self.classes:
-            if c.user_class == user_class:
-                return c
+        index = user_class.value
+        if not self.flags[index] & CLASS_PRESENT:
+            if not append:
+                return None
+
+            self.flags[index] |= CLASS_PRESENT
+            self.order.append(index)
+
+        return ClassProgress(self, user_class)
+
+    def restore_class(
+        self, user_class: UserClass, points: int, affinity: float
+    ) -> None:
+        self.get_class(user_class)
+        self.points[user_class.value] = points
+        self.affinities[user_class.value] = affinity
+
+    def sort_classes(self) -> None:
+        points = self.points
+        self.order = array("B", sorted(self.order, key=lambda i: (-points[i], i)))
+
+    def update_affinities(self) -> None:
+        if not self.stale:
+            return
 
-        if not append:
-            return None
+        points = self.points
+        flags = self.flags
+        max_value = max(points[i] for i in self.order)
+        exp_values = [
+            math.exp(p - max_value) if f & CLASS_PRESENT else 0.0
+            for p, f in zip(points, flags)
+        ]
+        sum_values = sum(exp_values)
 
-        cl = ClassProgress(user_class)
-        self.classes.append(cl)
-        return cl
+        self.affinities = array(
+            "d", [e / sum_values * p / 100 for e, p in zip(exp_values, points)]
+        )
+        self.sort_classes()
+        self.stale = False
 
     def get_class_list(self) -> List[ClassProgress]:
-        return self.classes
+        self.update_affinities()
+        return [ClassProgress(self, USER_CLASSES[i]) for i in self.order]
 
     def get_level(self) -> int:
         return self.level
@@ -196,7 +317,7 @@ class Essence:
         return self.exp
 
     def exp_to_next(self) -> int:
-        return math.floor(math.pow(10 * (self.level + 1), 1.5) * 3)
+        return EXP_TO_NEXT[self.level]
 
     def get_exp_percent(self) -> float:
         return self.exp / self.exp_to_next()
@@ -205,68 +326,48 @@ class Essence:
         return f"{math.floor(self.get_exp_percent() * 100)}%"
 
     def __add_exp(self, value: int) -> None:
-        self.exp += value
-
-        if self.exp < 0:
-            while True:
-                if self.level == 0:
-                    self.exp = 0
-                    return
+        total = TOTAL_EXP[self.level] + self.exp + value
 
-                self.level -= 1
-                self.exp += self.exp_to_next()
+        if total < 0:
+            self.level = 0
+            self.exp = 0
             return
 
-        while True:
-            needed = self.exp_to_next()
-            if self.exp < needed:
-                break
+        level = bisect_right(TOTAL_EXP, total) - 1
+        exp = total - TOTAL_EXP[level]
 
-            self.exp -= needed
-            self.level += 1
+        # Gains past the cap keep levelling before being clamped, leaving the
+        # remainder as exp on the capped level.
+        while exp >= exp_for_level(level):
+            exp -= exp_for_level(level)
+            level += 1
 
-        self.level = min(self.level, 244)
+        self.level = min(level, MAX_LEVEL)
+        self.exp = exp
 
     def get_realm(self) -> Realm:
-        realm = (self.level - 1) // 27
-        return Realm(realm)
+        return LEVEL_REALMS[self.level]
 
     def get_realm_progress(self) -> RealmProgress:
-        stage = (self.level - 1) // 9
-        return RealmProgress(stage % 3)
+        return LEVEL_REALM_PROGRESS[self.level]
 
     def get_stage(self) -> Stage:
-        stage = (self.level - 1) // 9
-        return Stage(stage)
+        return LEVEL_STAGES[self.level]
 
     def get_step(self) -> int:
-        step = ((self.level - 1) % 9) + 1
-        return step
+        return LEVEL_STEPS[self.level]
 
     def get_path(self) -> Path:
-        path = (self.level - 1) // 81
-        return Path(path)
+        return LEVEL_PATHS[self.level]
 
     def add_points(self, user_class: UserClass, value: int) -> None:
         self.__add_exp(value)
+        self.changed = True
+        self.version = next(VERSIONS)
 
         cl = self.get_class(user_class)
         cl.add_points(value)
 
-        affinities = [c.points for c in self.classes]
-        index = self.classes.index(cl)
-
-        max_value = max(affinities)
-        exp_values = [math.exp(v - max_value) for v in affinities]
-        sum_values = sum(exp_values)
-
-        relative = [v / sum_values for v in exp_values]
-
-        for i, r in enumerate(relative):
-            self.classes[i].affinity = r * self.classes[i].points / 100
-
-        self.classes.sort(key=lambda c: c.points, reverse=True)
-
 
 def affinity_to_grade(value: float) -> str:
     if value < 1:
@@ -1,6 +1,10 @@
 import os
-import feedparser
-from .sql import Database
+import asyncio
+import aiohttp
+from typing import Optional
+
+
+RR_FEED_URL = "https://www.royalroad.com/syndication/{fiction_id}"
 
 
 class Chapter:
@@ -12,35 +16,59 @@ class Chapter:
         self.chapter_id = chapter_id
 
 
-def get_latest_chapter_rr():
-    fiction_id = os.getenv("RR_FICTION_ID")
-    feed_url = f"https://www.royalroad.com/syndication/103454"
-    feed = feedparser.parse(feed_url)
+def get_rr_feed_url():
+    fiction_id = os.getenv("RR_FICTION_ID", "103454")
+    return RR_FEED_URL.format(fiction_id=fiction_id)
+
+
+async def fetch_feed(
+    session: aiohttp.ClientSession,
+    url,
+    etag=None,
+    last_modified=None,
+    timeout=30,
+):
+    headers = {}
+    if etag is not None:
+        headers["If-None-Match"] = etag
+    if last_modified is not None:
+        headers["If-Modified-Since"] = last_modified
+
+    async with session.get(
+        url, headers=headers, timeout=aiohttp.ClientTimeout(total=timeout)
+    ) as response:
+        # Nothing changed since the last poll, skip downloading and parsing
+        if response.status == 304:
+            return None, etag, last_modified
+
+        response.raise_for_status()
+        body = await response.read()
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+
+    loop = asyncio.get_running_loop()
+    feed = await loop.run_in_executor(None, parse_feed, body)
+    return feed, etag, last_modified
+
 
-    latest_name = feed.entries[0].title
-    latest_link = feed.entries[0].link
-    latest_id = feed.entries[0].guid
+def parse_feed(body: bytes):
+    # feedparser is slow to import and only needed once a feed has changed
+    import feedparser
 
-    title_parts = latest_name.split(" - ")
-    story = title_parts[0].strip()
-    index = int(title_parts[1].strip().split(" ")[1])
-    name = title_parts[2].strip()
+    return feedparser.parse(body)
 
-    return Chapter(index, name, story, latest_link, latest_id)
 
+def parse_chapter(entry) -> Optional[Chapter]:
+    try:
+        title_parts = entry.title.split(" - ")
+        story = title_parts[0].strip()
+        index = int(title_parts[1].strip().split(" ")[1])
+        name = title_parts[2].strip()
+    except (AttributeError, IndexError, ValueError):
+        return None
 
-def query_rr(db: Database):
-    chapter = get_latest_chapter_rr()
-    latest_chapter_id = db.get("latest_chapter_id")
+    return Chapter(index, name, story, entry.get("link"), entry.get("id"))
 
-    # If the latest chapter is not in the database, add it, but don't return anything
-    if latest_chapter_id is None:
-        db.set("latest_chapter_id", chapter.chapter_id)
-        print(f"Added last chapter to Database: {chapter.name}", flush=True)
-        return
 
-    # If the latest chapter is different from the one in the database, update the database and return the new chapter
-    elif latest_chapter_id != chapter.chapter_id:
-        db.set("latest_chapter_id", chapter.chapter_id)
-        print(f"New chapter: {chapter.name}", flush=True)
-        return chapter
+def get_entry_id(entry):
+    return entry.get("id") or entry.get("link") or entry.get("title")
@@ -0,0 +1,119 @@
+import os
+import json
+import logging
+import discord
+from typing import Dict, Optional
+from .rewards import get_reward_rules, parse_reward_rules
+
+
+log = logging.getLogger(__name__)
+
+WELCOME_MESSAGE = "Welcome to the Wraithaven server, {mention}!"
+SCRIBBLE_HUB_FOOTER = "[Scribble Hub](https://www.scribblehub.com/series/1421176/the-spoken-queens-swarm/)"
+
+
+def get_int(config, key: str) -> Optional[int]:
+    value = config.get(key)
+    if value is None:
+        return None
+    return int(value)
+
+
+class GuildConfig:
+    def __init__(
+        self,
+        guild_id: int,
+        announcements_channel_id: Optional[int] = None,
+        bot_spam_channel_id: Optional[int] = None,
+        new_members_channel_id: Optional[int] = None,
+        wave_sticker_id: Optional[int] = None,
+        role_message_id: Optional[int] = None,
+        role_mapping: Optional[Dict[discord.PartialEmoji, int]] = None,
+        updates_role_id: Optional[int] = None,
+        reward_rules=None,
+        welcome_message: str = WELCOME_MESSAGE,
+        migrate_rr_feed: bool = False,
+        feed_footer: Optional[str] = None,
+    ):
+        self.guild_id = guild_id
+        self.announcements_channel_id = announcements_channel_id
+        self.bot_spam_channel_id = bot_spam_channel_id
+        self.new_members_channel_id = new_members_channel_id
+        self.wave_sticker_id = wave_sticker_id
+        self.role_message_id = role_message_id
+        self.role_mapping = role_mapping if role_mapping is not None else {}
+        self.updates_role_id = updates_role_id
+        self.reward_rules = reward_rules if reward_rules is not None else {}
+        self.welcome_message = welcome_message
+        self.migrate_rr_feed = migrate_rr_feed
+        self.feed_footer = feed_footer
+
+    @classmethod
+    def from_env(cls) -> "GuildConfig":
+        # The single guild setup every deployment used before GUILDS_FILE
+        env = os.environ
+        updates_role_id = get_int(env, "TSQS_UPDATES_ROLE_ID")
+
+        role_mapping = {}
+        if updates_role_id is not None:
+            role_mapping[discord.PartialEmoji(name="🪰")] = updates_role_id
+
+        return cls(
+            int(env["GUILD_ID"]),
+            announcements_channel_id=get_int(env, "ANNOUNCEMENTS_CHANNEL_ID"),
+            bot_spam_channel_id=get_int(env, "BOT_SPAM_CHANNEL_ID"),
+            new_members_channel_id=get_int(env, "NEW_MEMBERS_CHANNEL_ID"),
+            wave_sticker_id=get_int(env, "WAVE_STICKER_ID"),
+            role_message_id=get_int(env, "ROLE_MESSAGE_ID"),
+            role_mapping=role_mapping,
+            updates_role_id=updates_role_id,
+            reward_rules=get_reward_rules(),
+            migrate_rr_feed=True,
+            feed_footer=SCRIBBLE_HUB_FOOTER,
+        )
+
+    @classmethod
+    def from_dict(cls, guild_id, config: dict) -> "GuildConfig":
+        role_mapping = {
+            discord.PartialEmoji.from_str(emoji): int(role_id)
+            for emoji, role_id in config.get("role_mapping", {}).items()
+        }
+
+        return cls(
+            int(guild_id),
+            announcements_channel_id=get_int(config, "announcements_channel_id"),
+            bot_spam_channel_id=get_int(config, "bot_spam_channel_id"),
+            new_members_channel_id=get_int(config, "new_members_channel_id"),
+            wave_sticker_id=get_int(config, "wave_sticker_id"),
+            role_message_id=get_int(config, "role_message_id"),
+            role_mapping=role_mapping,
+            updates_role_id=get_int(config, "updates_role_id"),
+            reward_rules=parse_reward_rules(config.get("rewards", {})),
+            welcome_message=config.get("welcome_message", WELCOME_MESSAGE),
+            migrate_rr_feed=config.get("migrate_rr_feed", False),
+            feed_footer=config.get("feed_footer"),
+        )
+
+
+# The guilds file maps guild ids to their config, for example:
+#   {"1234": {"bot_spam_channel_id": 5678, "role_message_id": 9012,
+#             "role_mapping": {"🪰": 3456}, "rewards": {...}}}
+# where "rewards" uses the same format as the reward rules file.
+def load_guild_configs(path: str) -> Dict[int, GuildConfig]:
+    with open(path, "r", encoding="utf-8") as f:
+        config = json.load(f)
+
+    return {
+        int(guild_id): GuildConfig.from_dict(guild_id, entry)
+        for guild_id, entry in config.items()
+    }
+
+
+def get_guild_configs() -> Dict[int, GuildConfig]:
+    path = os.getenv("GUILDS_FILE")
+    if path is not None and os.path.exists(path):
+        log.info("Loading guild configs from %s", path)
+        return load_guild_configs(path)
+
+    config = GuildConfig.from_env()
+    return {config.guild_id: config}
@@ -0,0 +1,92 @@
+from bisect import bisect_left, bisect_right, insort
+from typing import List, Optional, Tuple
+from .essence import Essence, UserClass, TOTAL_EXP, MAX_LEVEL
+
+
+def get_level_for_exp(total: int) -> int:
+    return min(bisect_right(TOTAL_EXP, total) - 1, MAX_LEVEL)
+
+
+class Board:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.scores = {}
+        self.entries = []
+        self.stale = False
+
+    def reset(self, rows) -> None:
+        self.scores = {}
+        self.entries = []
+        self.stale = False
+
+        for member_id, score in rows:
+            self.update(member_id, score)
+
+    def update(self, member_id, score) -> None:
+        old = self.scores.get(member_id)
+        full = len(self.entries) >= self.capacity
+
+        if old is not None:
+            if old == score:
+                return
+
+            del self.entries[bisect_left(self.entries, (-old, member_id))]
+            del self.scores[member_id]
+        elif full and (-score, member_id) >= self.entries[-1]:
+            return
+
+        entry = (-score, member_id)
+        insort(self.entries, entry)
+        self.scores[member_id] = score
+
+        if len(self.entries) > self.capacity:
+            _, dropped = self.entries.pop()
+            del self.scores[dropped]
+
+        # Members we do not hold may now rank above someone who lost points
+        # and fell to the end of a full board, so reload it before trusting it.
+        if full and old is not None and score < old and self.entries[-1] == entry:
+            self.stale = True
+
+    def top(self, count: int) -> List[Tuple[int, int]]:
+        return [(member_id, -score) for score, member_id in self.entries[:count]]
+
+
+class Leaderboard:
+    def __init__(self, db, size: int = 10):
+        self.db = db
+        self.size = size
+
+        # Hold a few extra members so small drops rarely force a reload
+        capacity = size * 2
+        self.overall = Board(capacity)
+        self.classes = {user_class: Board(capacity) for user_class in UserClass}
+
+    async def load(self) -> None:
+        await self.reload(self.overall, None)
+        for user_class, board in self.classes.items():
+            await self.reload(board, user_class)
+
+    async def reload(self, board: Board, user_class: Optional[UserClass]) -> None:
+        if user_class is None:
+            rows = await self.db.get_top_members(board.capacity)
+            board.reset((m, TOTAL_EXP[level] + exp) for m, level, exp in rows)
+        else:
+            rows = await self.db.get_top_class_members(user_class, board.capacity)
+            board.reset(rows)
+
+    def update(self, member_id, essence: Essence) -> None:
+        self.overall.update(member_id, TOTAL_EXP[essence.level] + essence.exp)
+
+        for class_progress in essence.get_class_list():
+            board = self.classes[class_progress.user_class]
+            board.update(member_id, class_progress.points)
+
+    async def top(self, user_class: Optional[UserClass] = None):
+        board = self.overall if user_class is None else self.classes[user_class]
+        if board.stale:
+            # Rankings are read from the snapshot, bring it up to date first
+            await self.db.compact()
+            await self.reload(board, user_class)
+
+        return board.top(self.size)
@@ -0,0 +1,107 @@
+import os
+import sys
+import json
+import queue
+import atexit
+import logging
+import logging.handlers
+from typing import Optional
+
+
+# Extra record attributes copied into the JSON output, and the key used for each
+FIELDS = {
+    "member": "member",
+    "member_id": "member_id",
+    "channel": "channel",
+    "user_class": "class",
+    "points": "points",
+    "awards": "awards",
+    "phases": "phases",
+}
+
+listener: Optional[logging.handlers.QueueListener] = None
+
+
+class LocalQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Records never leave the process, so formatting them, including any
+        # traceback, is left to the listener thread.
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "category": record.name,
+            "message": record.getMessage(),
+        }
+
+        for attr, key in FIELDS.items():
+            value = getattr(record, attr, None)
+            if value is not None:
+                data[key] = value
+
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+def parse_levels(value: Optional[str]):
+    # LOG_LEVELS looks like "sarica.awards=WARNING,discord=INFO"
+    levels = {}
+    if value is None:
+        return levels
+
+    for part in value.split(","):
+        if "=" not in part:
+            continue
+
+        name, level = part.split("=", 1)
+        levels[name.strip()] = level.strip().upper()
+
+    return levels
+
+
+def setup_logging() -> None:
+    global listener
+    if listener is not None:
+        return
+
+    log_file = os.getenv("LOG_FILE")
+    if log_file is not None:
+        handler = logging.handlers.RotatingFileHandler(
+            log_file,
+            maxBytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+            backupCount=int(os.getenv("LOG_BACKUP_COUNT", "5")),
+            encoding="utf-8",
+        )
+    else:
+        handler = logging.StreamHandler(sys.stdout)
+
+    handler.setFormatter(JsonFormatter())
+
+    # Handlers only put records on the queue; a background thread formats
+    # and writes them, so logging never blocks the event loop on disk I/O.
+    records = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.addHandler(LocalQueueHandler(records))
+    root.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+    for name, level in parse_levels(os.getenv("LOG_LEVELS")).items():
+        logging.getLogger(name).setLevel(level)
+
+    listener = logging.handlers.QueueListener(records, handler)
+    listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    global listener
+    if listener is None:
+        return
+
+    listener.stop()
+    listener = None
@@ -0,0 +1,272 @@
+import time
+import asyncio
+import logging
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+if TYPE_CHECKING:
+    from aiohttp import web
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+registry = []
+
+
+def format_labels(names, values) -> str:
+    if len(names) == 0:
+        return ""
+
+    pairs = [f'{n}="{str(v)}"' for n, v in zip(names, values)]
+    return "{" + ",".join(pairs) + "}"
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(labels)
+        self.children = {}
+        registry.append(self)
+
+    def labels(self, *values):
+        child = self.children.get(values)
+        if child is None:
+            child = self.new_child()
+            self.children[values] = child
+        return child
+
+    def new_child(self):
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.description}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for values, child in list(self.children.items()):
+            lines.extend(self.render_child(values, child))
+        return lines
+
+    def render_child(self, values, child) -> List[str]:
+        raise NotImplementedError
+
+
+class CounterValue:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1) -> None:
+        self.value += amount
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def new_child(self):
+        return CounterValue()
+
+    def inc(self, amount=1) -> None:
+        self.labels().inc(amount)
+
+    def render_child(self, values, child) -> List[str]:
+        return [f"{self.name}{format_labels(self.label_names, values)} {child.value}"]
+
+
+class HistogramValue:
+    __slots__ = ("buckets", "counts", "count", "sum")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        # Same linear interpolation inside a bucket as Prometheus'
+        # histogram_quantile, good enough for a quick look in /stats.
+        if self.count == 0:
+            return None
+
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count > 0:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+
+        return self.buckets[-1]
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Tuple[str, ...] = (),
+        buckets=DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+
+    def new_child(self):
+        return HistogramValue(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def render_child(self, values, child) -> List[str]:
+        lines = []
+        names = self.label_names + ("le",)
+        total = 0
+        for bound, count in zip(self.buckets + (float("inf"),), child.counts):
+            total += count
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(
+                f"{self.name}_bucket{format_labels(names, values + (le,))} {total}"
+            )
+
+        labels = format_labels(self.label_names, values)
+        lines.append(f"{self.name}_sum{labels} {child.sum}")
+        lines.append(f"{self.name}_count{labels} {child.count}")
+        return lines
+
+
+class CallbackMetric(Metric):
+    def __init__(
+        self,
+        name: str,
+        description: str,
+        labels: Tuple[str, ...],
+        callback: Callable[[], Dict[tuple, float]],
+        kind: str = "gauge",
+    ):
+        super().__init__(name, description, labels)
+        self.callback = callback
+        self.kind = kind
+
+    def render(self) -> List[str]:
+        self.children = self.callback()
+        return super().render()
+
+    def render_child(self, values, child) -> List[str]:
+        return [f"{self.name}{format_labels(self.label_names, values)} {child}"]
+
+
+HANDLER_SECONDS = Histogram(
+    "sarica_handler_seconds", "Time spent in event and command handlers.", ("handler",)
+)
+DB_SECONDS = Histogram(
+    "sarica_db_seconds", "Time spent running database operations.", ("operation",)
+)
+EVENTS = Counter("sarica_events_total", "Discord events handled.", ("event",))
+AWARDS = Counter("sarica_awards_total", "Essence awards given.", ("class",))
+AWARD_POINTS = Counter(
+    "sarica_award_points_total", "Essence points awarded.", ("class",)
+)
+AWARDS_COLLAPSED = Counter(
+    "sarica_awards_collapsed_total",
+    "Awards merged into one already waiting for the same member and class.",
+)
+AWARD_POINTS_CAPPED = Counter(
+    "sarica_award_points_capped_total", "Points withheld by the per-member rate cap."
+)
+OUTBOX_SENT = Counter(
+    "sarica_outbox_sent_total", "Messages sent from the outbox.", ("lane",)
+)
+OUTBOX_COALESCED = Counter(
+    "sarica_outbox_coalesced_total", "Queued lines folded into another message."
+)
+LOOP_LAG = Histogram(
+    "sarica_event_loop_lag_seconds",
+    "How late the event loop ran a scheduled wake-up.",
+)
+
+
+def render() -> str:
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+async def monitor_loop_lag(interval: float = 1.0) -> None:
+    loop = asyncio.get_running_loop()
+    lag = LOOP_LAG.labels()
+
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag.observe(max(0.0, loop.time() - start - interval))
+
+
+async def start_metrics_server(host: str, port: int) -> Optional["web.AppRunner"]:
+    # Most deployments never serve metrics, so skip importing aiohttp.web
+    from aiohttp import web
+
+    async def metrics_handler(request):
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+
+    try:
+        await web.TCPSite(runner, host, port).start()
+    except OSError as e:
+        log.warning("Could not start metrics server on %s:%d: %s", host, port, e)
+        await runner.cleanup()
+        return None
+
+    log.info("Serving metrics on http://%s:%d/metrics", host, port)
+    return runner
+
+
+class Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram: HistogramValue):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+        return False
@@ -0,0 +1,189 @@
+import asyncio
+import logging
+import discord
+from collections import deque
+from enum import IntEnum
+from typing import Optional
+from .metrics import OUTBOX_SENT, OUTBOX_COALESCED
+
+
+log = logging.getLogger(__name__)
+
+MAX_MESSAGE_LENGTH = 2000
+
+
+class Lane(IntEnum):
+    Announcement = 0
+    Welcome = 1
+    Bot_Spam = 2
+
+
+LANE_SENT = {lane: OUTBOX_SENT.labels(lane.name) for lane in Lane}
+
+
+class OutboundMessage:
+    __slots__ = ("content", "stickers", "coalesce")
+
+    def __init__(self, content: Optional[str], stickers=(), coalesce=False):
+        self.content = content
+        self.stickers = list(stickers)
+        self.coalesce = coalesce
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = None
+
+    def take(self, now: float) -> float:
+        # Returns how long to wait before a token is available, taking one if
+        # it is available right away.
+        if self.updated is not None:
+            elapsed = now - self.updated
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+
+        return (1 - self.tokens) / self.rate
+
+
+class ChannelQueue:
+    def __init__(self, outbox: "Outbox", channel_id: int):
+        self.outbox = outbox
+        self.channel_id = channel_id
+        self.bucket = TokenBucket(outbox.rate, outbox.burst)
+        self.lanes = {lane: deque() for lane in Lane}
+        self.worker = None
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    def put(self, lane: Lane, message: OutboundMessage) -> None:
+        self.lanes[lane].append(message)
+        if self.worker is None:
+            self.idle.clear()
+            self.worker = asyncio.ensure_future(self.run())
+
+    def next_lane(self) -> Optional[Lane]:
+        for lane in Lane:
+            if len(self.lanes[lane]) > 0:
+                return lane
+        return None
+
+    def pop(self, lane: Lane) -> OutboundMessage:
+        queue = self.lanes[lane]
+        message = queue.popleft()
+        if not message.coalesce:
+            return message
+
+        # Fold the short lines queued behind this one into a single message
+        lines = [message.content]
+        length = len(message.content)
+        while len(queue) > 0 and queue[0].coalesce and len(queue[0].stickers) == 0:
+            added = len(queue[0].content) + 1
+            if length + added > MAX_MESSAGE_LENGTH:
+                break
+
+            lines.append(queue.popleft().content)
+            length += added
+
+        if len(lines) > 1:
+            OUTBOX_COALESCED.inc(len(lines) - 1)
+
+        return OutboundMessage("\n".join(lines), message.stickers)
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                lane = self.next_lane()
+                if lane is None:
+                    break
+
+                # Re-pick the lane after waiting, something more urgent may
+                # have been queued in the meantime.
+                wait = self.bucket.take(loop.time())
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                    continue
+
+                message = self.pop(lane)
+                await self.outbox.deliver(self.channel_id, lane, message)
+        finally:
+            self.worker = None
+            self.idle.set()
+
+
+class Outbox:
+    def __init__(self, client: discord.Client, rate: float = 1.0, burst: int = 5):
+        self.client = client
+        self.rate = rate
+        self.burst = burst
+        self.queues = {}
+        self.channels = {}
+
+    def send(
+        self,
+        channel_id: Optional[int],
+        content: Optional[str] = None,
+        lane: Lane = Lane.Bot_Spam,
+        stickers=(),
+        coalesce: bool = False,
+    ) -> None:
+        if channel_id is None:
+            return
+
+        queue = self.queues.get(channel_id)
+        if queue is None:
+            queue = ChannelQueue(self, channel_id)
+            self.queues[channel_id] = queue
+
+        queue.put(lane, OutboundMessage(content, stickers, coalesce))
+
+    async def get_channel(self, channel_id: int):
+        channel = self.channels.get(channel_id)
+        if channel is not None:
+            return channel
+
+        channel = self.client.get_channel(channel_id)
+        if channel is None:
+            try:
+                channel = await self.client.fetch_channel(channel_id)
+            except discord.HTTPException as e:
+                log.warning("Channel %d not found: %s", channel_id, e)
+                return None
+
+        self.channels[channel_id] = channel
+        return channel
+
+    async def deliver(self, channel_id: int, lane: Lane, message: OutboundMessage):
+        channel = await self.get_channel(channel_id)
+        if channel is None:
+            return
+
+        try:
+            await channel.send(message.content, stickers=message.stickers)
+        except (discord.NotFound, discord.Forbidden) as e:
+            # The channel may have been deleted or hidden, look it up again
+            self.channels.pop(channel_id, None)
+            log.warning("Could not send to channel %d: %s", channel_id, e)
+            return
+        except discord.HTTPException as e:
+            log.warning("Could not send to channel %d: %s", channel_id, e)
+            return
+
+        LANE_SENT[lane].inc()
+
+    async def drain(self, timeout: Optional[float] = None) -> None:
+        waits = [queue.idle.wait() for queue in self.queues.values()]
+        if len(waits) == 0:
+            return
+
+        try:
+            await asyncio.wait_for(asyncio.gather(*waits), timeout)
+        except asyncio.TimeoutError:
+            log.warning("Gave up waiting for queued messages to be sent")
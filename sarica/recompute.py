@@ -0,0 +1,168 @@
+import math
+import numpy as np
+from .essence import (
+    CLASS_COUNT,
+    Realm,
+    LEVEL_PATHS,
+    LEVEL_REALMS,
+    LEVEL_STAGES,
+    MAX_LEVEL,
+    TOTAL_EXP,
+    exp_for_level,
+)
+
+
+# Every grade affinity_to_grade can return, indexed by get_grade_indices
+GRADES = (
+    ["X"]
+    + [
+        letter + sign
+        for letter in ["F", "E", "D", "C", "B", "A", "S", "SS", "SSS"]
+        for sign in ["-", "", "+"]
+    ]
+    + ["Z"]
+)
+
+TOTAL_EXP_ARRAY = np.array(TOTAL_EXP, dtype=np.int64)
+LEVEL_REALM_VALUES = np.array([r.value for r in LEVEL_REALMS], dtype=np.int64)
+LEVEL_STAGE_VALUES = np.array([s.value for s in LEVEL_STAGES], dtype=np.int64)
+LEVEL_PATH_VALUES = np.array([p.value for p in LEVEL_PATHS], dtype=np.int64)
+LOG_3 = math.log(3)
+
+CLASS_ROW = np.dtype(
+    [
+        ("member_id", np.int64),
+        ("class_id", np.int64),
+        ("points", np.int64),
+        ("affinity", np.float64),
+    ]
+)
+MEMBER_ROW = np.dtype([("member_id", np.int64), ("exp", np.int64), ("level", np.int64)])
+
+
+def get_levels(totals: np.ndarray):
+    # Same result as Essence.add_points given the total in one award
+    levels = np.searchsorted(TOTAL_EXP_ARRAY, totals, side="right") - 1
+    exps = totals - TOTAL_EXP_ARRAY[levels]
+
+    # Only members past the cap keep levelling, there are few enough of them
+    # to follow the scalar rule one by one
+    for i in np.nonzero(levels > MAX_LEVEL)[0]:
+        level = int(levels[i])
+        exp = int(exps[i])
+        while exp >= exp_for_level(level):
+            exp -= exp_for_level(level)
+            level += 1
+        exps[i] = exp
+
+    return np.minimum(levels, MAX_LEVEL), exps
+
+
+def get_affinities(points: np.ndarray, present: np.ndarray) -> np.ndarray:
+    # Softmax over the classes a member has, weighted by their points, the
+    # same as Essence.update_affinities
+    masked = np.where(present, points, np.iinfo(np.int64).min)
+    top = masked.max(axis=1, keepdims=True)
+    shifted = np.where(present, points - top, 0).astype(np.float64)
+    weights = np.where(present, np.exp(shifted), 0.0)
+    return weights / weights.sum(axis=1, keepdims=True) * points / 100
+
+
+def get_grade_indices(affinities: np.ndarray) -> np.ndarray:
+    # Affinities below 1 are X, the log is only used for the rest
+    with np.errstate(divide="ignore", invalid="ignore"):
+        logs = np.log(affinities) / LOG_3
+        letters = np.floor(logs)
+        signs = np.floor((logs - letters) * 3)
+
+    indices = np.where(letters >= 9, len(GRADES) - 1, 1 + letters * 3 + signs)
+    return np.where(affinities < 1, 0, indices).astype(np.int64)
+
+
+class Recomputed:
+    def __init__(self, classes, members=()):
+        # classes are (member_id, class_id, points, affinity) rows from the
+        # classes table, members the stored (member_id, exp, level) rows
+        table = np.fromiter(classes, dtype=CLASS_ROW, count=len(classes))
+        self.member_ids, index = np.unique(table["member_id"], return_inverse=True)
+
+        shape = (len(self.member_ids), CLASS_COUNT)
+        self.points = np.zeros(shape, dtype=np.int64)
+        self.present = np.zeros(shape, dtype=bool)
+        stored = np.zeros(shape, dtype=np.float64)
+        self.points[index, table["class_id"]] = table["points"]
+        self.present[index, table["class_id"]] = True
+        stored[index, table["class_id"]] = table["affinity"]
+
+        totals = np.maximum(self.points.sum(axis=1), 0)
+        self.levels, self.exps = get_levels(totals)
+        self.affinities = get_affinities(self.points, self.present)
+
+        # Members whose stored values already match are not written again
+        old_exps = np.full(len(self.member_ids), -1, dtype=np.int64)
+        old_levels = np.full(len(self.member_ids), -1, dtype=np.int64)
+        if len(members) > 0 and len(self.member_ids) > 0:
+            stored_members = np.fromiter(members, dtype=MEMBER_ROW, count=len(members))
+            ids = stored_members["member_id"]
+            found = np.searchsorted(self.member_ids, ids)
+            found = np.minimum(found, len(self.member_ids) - 1)
+            known = self.member_ids[found] == ids
+            old_exps[found[known]] = stored_members["exp"][known]
+            old_levels[found[known]] = stored_members["level"][known]
+
+        level_changed = self.levels != old_levels
+        self.changed = (
+            level_changed
+            | (self.exps != old_exps)
+            | ~np.isclose(stored, self.affinities, rtol=1e-9, atol=0).all(axis=1)
+        )
+        self.level_changes = int(level_changed.sum())
+        self.written = int(self.changed.sum())
+
+    def __len__(self) -> int:
+        return len(self.member_ids)
+
+    def get_grades(self) -> np.ndarray:
+        return get_grade_indices(self.affinities)
+
+    def get_top_grades(self) -> np.ndarray:
+        top = np.where(self.present, self.affinities, 0.0).max(axis=1)
+        return get_grade_indices(top)
+
+    def get_realms(self) -> np.ndarray:
+        return LEVEL_REALM_VALUES[self.levels]
+
+    def get_stages(self) -> np.ndarray:
+        return LEVEL_STAGE_VALUES[self.levels]
+
+    def get_paths(self) -> np.ndarray:
+        return LEVEL_PATH_VALUES[self.levels]
+
+    def count_realms(self):
+        values, counts = np.unique(self.get_realms(), return_counts=True)
+        return [(Realm(v), c) for v, c in zip(values.tolist(), counts.tolist())]
+
+    def count_top_grades(self):
+        values, counts = np.unique(self.get_top_grades(), return_counts=True)
+        return [(GRADES[v], c) for v, c in zip(values.tolist(), counts.tolist())]
+
+    def member_rows(self):
+        changed = self.changed
+        return list(
+            zip(
+                self.member_ids[changed].tolist(),
+                self.exps[changed].tolist(),
+                self.levels[changed].tolist(),
+            )
+        )
+
+    def class_rows(self):
+        members, classes = np.nonzero(self.present & self.changed[:, None])
+        return list(
+            zip(
+                self.member_ids[members].tolist(),
+                classes.tolist(),
+                self.points[members, classes].tolist(),
+                self.affinities[members, classes].tolist(),
+            )
+        )
@@ -0,0 +1,98 @@
+import sys
+import hashlib
+import logging
+import importlib
+from typing import Dict, List
+
+
+log = logging.getLogger(__name__)
+
+# Modules that hold no live state of their own, in the order they are reloaded.
+# Everything else either owns objects the running bot depends on, such as the
+# UserClass enum, Essence layout, database connections, metrics, GuildState and
+# feed subscriptions, or is the bot itself, so a change to any other module
+# needs a full restart. A class with live instances must never move in here,
+# those instances would keep the old class.
+HOT_MODULES = [
+    "sarica.table",
+    "sarica.card",
+    "sarica.rewards",
+    "sarica.feed",
+    "sarica.guild",
+]
+
+
+def get_source_hash(module) -> str:
+    path = getattr(module, "__file__", None)
+    if path is None:
+        return ""
+
+    try:
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return ""
+
+
+def get_sarica_modules() -> Dict[str, object]:
+    return {
+        name: module
+        for name, module in list(sys.modules.items())
+        if name == "sarica" or name.startswith("sarica.")
+    }
+
+
+class ReloadError(Exception):
+    pass
+
+
+class Reloader:
+    def __init__(self):
+        self.hashes = {}
+        self.snapshot()
+
+    def snapshot(self, names: List[str] = None) -> None:
+        modules = get_sarica_modules()
+        if names is not None:
+            modules = {name: modules[name] for name in names if name in modules}
+
+        for name, module in modules.items():
+            self.hashes[name] = get_source_hash(module)
+
+    def changed(self) -> List[str]:
+        changed = []
+        for name, module in get_sarica_modules().items():
+            source_hash = get_source_hash(module)
+            if name not in self.hashes:
+                # Imported lazily after startup, from the source that is on
+                # disk now, so there is nothing to reload yet
+                self.hashes[name] = source_hash
+            elif self.hashes[name] != source_hash:
+                changed.append(name)
+        return changed
+
+    def needs_restart(self, changed: List[str]) -> bool:
+        return any(name not in HOT_MODULES for name in changed)
+
+    def reload(self, changed: List[str]) -> List[str]:
+        # Compile everything first, a syntax error must not leave half of the
+        # modules reloaded.
+        for name in changed:
+            module = sys.modules[name]
+            try:
+                with open(module.__file__, "rb") as f:
+                    compile(f.read(), module.__file__, "exec")
+            except (OSError, SyntaxError) as e:
+                raise ReloadError(f"{name}: {e}") from e
+
+        # Later modules import names from earlier ones, so once one module is
+        # reloaded everything after it is reloaded as well.
+        reloaded = []
+        for name in HOT_MODULES:
+            if name in changed or len(reloaded) > 0:
+                importlib.reload(sys.modules[name])
+                reloaded.append(name)
+
+        self.snapshot(reloaded)
+        log.info("Reloaded %s", ", ".join(reloaded))
+        return reloaded
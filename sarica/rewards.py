@@ -0,0 +1,230 @@
+import os
+import json
+import logging
+import discord
+from datetime import timedelta
+from typing import Dict, List, Optional, Tuple
+from .essence import UserClass
+
+
+log = logging.getLogger(__name__)
+
+
+class RewardRule:
+    def __init__(
+        self,
+        user_class: UserClass,
+        description: str,
+        points: int = 0,
+        attachment_points: int = 0,
+        content_points: int = 0,
+        thread_owner: bool = False,
+    ):
+        self.user_class = user_class
+        self.description = description
+        self.points = points
+        self.attachment_points = attachment_points
+        self.content_points = content_points
+        self.thread_owner = thread_owner
+
+    def get_points(self, message: discord.Message) -> Optional[int]:
+        if self.thread_owner and (
+            message.thread is None or message.thread.owner_id != message.author.id
+        ):
+            return None
+
+        points = self.points + len(message.attachments) * self.attachment_points
+        if message.content is not None and len(message.content) > 0:
+            points += self.content_points
+
+        return points
+
+
+class GreetingRule(RewardRule):
+    def __init__(
+        self, user_class: UserClass, description: str, points: int = 100, days: int = 1
+    ):
+        super().__init__(user_class, description, points=points)
+        self.days = days
+
+    def get_points(self, message: discord.Message) -> Optional[int]:
+        join_cutoff = message.created_at - timedelta(days=self.days)
+        points = 0
+
+        for mention in message.mentions:
+            joined_at = getattr(mention, "joined_at", None)
+            if joined_at is None or joined_at < join_cutoff:
+                continue
+
+            points += self.points
+
+        if points == 0:
+            return None
+
+        return points
+
+
+class IntroductionRule(RewardRule):
+    def __init__(
+        self,
+        user_class: UserClass,
+        description: str,
+        points: int = 50,
+        new_member_points: int = 500,
+        days: int = 3,
+    ):
+        super().__init__(user_class, description, points=points)
+        self.new_member_points = new_member_points
+        self.days = days
+
+    def get_points(self, message: discord.Message) -> Optional[int]:
+        join_cutoff = message.created_at - timedelta(days=self.days)
+        joined_at = getattr(message.author, "joined_at", None)
+
+        if joined_at is not None and joined_at >= join_cutoff:
+            return self.new_member_points
+
+        return self.points
+
+
+def get_message_awards(
+    message: discord.Message, rules: Dict[int, List[RewardRule]]
+) -> List[Tuple[UserClass, int, str]]:
+    # Shared by on_message and the history backfill so both award the same
+    awards = [(UserClass.Social_Butterfly, 1, "posted a message")]
+
+    stickers = len(message.stickers)
+    if stickers > 0:
+        awards.append((UserClass.Sticker_Collector, stickers * 5, "posted a sticker"))
+
+    for rule in rules.get(message.channel.id, ()):
+        points = rule.get_points(message)
+        if points is None:
+            continue
+
+        awards.append((rule.user_class, points, rule.description))
+
+    return awards
+
+
+RULE_TYPES = {
+    "points": RewardRule,
+    "greeting": GreetingRule,
+    "introduction": IntroductionRule,
+}
+
+
+def add_rule(rules: Dict[int, List[RewardRule]], channel_id, rule: RewardRule) -> None:
+    if channel_id is None:
+        return
+
+    rules.setdefault(int(channel_id), []).append(rule)
+
+
+# The rules file maps channel ids to a list of rules, for example:
+#   {"1234": [{"class": "Jester", "description": "posted a meme",
+#              "attachment_points": 100, "content_points": 1}]}
+def load_reward_rules(path: str) -> Dict[int, List[RewardRule]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return parse_reward_rules(json.load(f))
+
+
+def parse_reward_rules(config: dict) -> Dict[int, List[RewardRule]]:
+    rules = {}
+    for channel_id, entries in config.items():
+        for entry in entries:
+            entry = dict(entry)
+            rule_type = RULE_TYPES[entry.pop("type", "points")]
+            user_class = UserClass[entry.pop("class")]
+            add_rule(rules, channel_id, rule_type(user_class, **entry))
+
+    return rules
+
+
+def default_reward_rules() -> Dict[int, List[RewardRule]]:
+    env = os.getenv
+    rules = {}
+
+    def showcase(channel_id, user_class, description):
+        add_rule(
+            rules,
+            channel_id,
+            RewardRule(
+                user_class,
+                description,
+                attachment_points=1000,
+                content_points=1,
+                thread_owner=True,
+            ),
+        )
+
+    def gallery(channel_id, user_class, description):
+        add_rule(
+            rules,
+            channel_id,
+            RewardRule(
+                user_class, description, attachment_points=100, content_points=1
+            ),
+        )
+
+    def discussion(channel_id, user_class, description, points=10):
+        add_rule(rules, channel_id, RewardRule(user_class, description, points=points))
+
+    gallery(env("MEMES_CHANNEL_ID"), UserClass.Jester, "posted a meme")
+    add_rule(
+        rules,
+        env("NEW_MEMBERS_CHANNEL_ID"),
+        GreetingRule(UserClass.Friendly_Guide, "has greeted a new user(s)"),
+    )
+    gallery(env("CUTE_PICS_CHANNEL_ID"), UserClass.Soul_Healer, "posted a cute pic")
+    gallery(env("NSFW_CHANNEL_ID"), UserClass.Deviant, "posted a NSFW pic")
+
+    for channel_id in [env("TSQS_CHANNEL_ID"), env("TSQS_SPOILER_CHANNEL_ID")]:
+        discussion(channel_id, UserClass.Bug_Girl_Connoisseur, "talked about TSQS")
+        discussion(channel_id, UserClass.Reader, "talked about a book", points=1)
+
+    discussion(env("SUGGESTIONS_CHANNEL_ID"), UserClass.Visionary, "made a suggestion")
+    discussion(
+        env("THEORYCRAFTING_CHANNEL_ID"), UserClass.Conspiracy_Theorist, "theorycrafted"
+    )
+    discussion(env("Q_AND_A_CHANNEL_ID"), UserClass.Researcher, "asked a question")
+    discussion(
+        env("SERVER_DISCUSSION_CHANNEL_ID"),
+        UserClass.Tech_Support,
+        "discussed meta server topics",
+    )
+    discussion(
+        env("BOT_SPAM_CHANNEL_ID"),
+        UserClass.Tech_Support,
+        "talked in bot spam",
+        points=1,
+    )
+    gallery(
+        env("COOL_STUFF_CHANNEL_ID"), UserClass.Web_Archiver, "posted something cool"
+    )
+    showcase(env("SHOW_OFF_CHANNEL_ID"), UserClass.Content_Creator, "showed off")
+    add_rule(
+        rules,
+        env("INTRODUCTIONS_CHANNEL_ID"),
+        IntroductionRule(UserClass.Social_Butterfly, "introduced themselves"),
+    )
+    for channel_id, user_class, description in [
+        (env("FAN_ART_CHANNEL_ID"), UserClass.Artist, "posted fan art"),
+        (env("FAN_GAMES_CHANNEL_ID"), UserClass.GameDev, "posted a fan game"),
+        (env("FAN_BOOKS_CHANNEL_ID"), UserClass.Storyteller, "posted a fan book"),
+    ]:
+        showcase(channel_id, user_class, description)
+        showcase(channel_id, UserClass.Content_Creator, "showed off")
+
+    discussion(env("BOOK_DISCUSSION_CHANNEL_ID"), UserClass.Reader, "discussed a book")
+
+    return rules
+
+
+def get_reward_rules() -> Dict[int, List[RewardRule]]:
+    path = os.getenv("REWARD_RULES_FILE")
+    if path is not None and os.path.exists(path):
+        log.info("Loading reward rules from %s", path)
+        return load_reward_rules(path)
+
+    return default_reward_rules()
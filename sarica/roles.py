@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import discord
+from typing import Dict, Optional
+from .sql import Database
+
+
+log = logging.getLogger(__name__)
+
+
+def get_emoji_key(emoji: discord.PartialEmoji) -> str:
+    # PartialEmoji hashes on its name too, which custom emojis can change, so
+    # custom emojis are keyed by id and unicode ones by the emoji itself
+    return str(emoji.id) if emoji.id is not None else emoji.name
+
+
+class RoleMenus:
+    def __init__(self, db: Database):
+        self.db = db
+
+        # message id -> {emoji key: role id}, a reaction on any other message
+        # misses on the first lookup
+        self.menus: Dict[int, Dict[str, int]] = {}
+
+    async def load(self) -> None:
+        self.menus = {}
+        for message_id, key, role_id in await self.db.get_role_menus():
+            self.menus.setdefault(message_id, {})[key] = role_id
+
+    def route(self, message_id, emoji: discord.PartialEmoji) -> Optional[int]:
+        menu = self.menus.get(message_id)
+        if menu is None:
+            return None
+
+        return menu.get(get_emoji_key(emoji))
+
+    async def add(self, message_id, emoji: discord.PartialEmoji, role_id) -> None:
+        key = get_emoji_key(emoji)
+        await self.db.add_role_menu_entry(message_id, key, role_id)
+        self.menus.setdefault(message_id, {})[key] = role_id
+
+    async def remove(self, message_id, emoji: discord.PartialEmoji = None) -> int:
+        menu = self.menus.get(message_id)
+        if menu is None:
+            return 0
+
+        if emoji is None:
+            del self.menus[message_id]
+            return await self.db.remove_role_menu_entries(message_id)
+
+        key = get_emoji_key(emoji)
+        if menu.pop(key, None) is None:
+            return 0
+
+        if len(menu) == 0:
+            del self.menus[message_id]
+
+        return await self.db.remove_role_menu_entries(message_id, key)
+
+    async def migrate_config(self, message_id, mapping) -> None:
+        # Older versions configured a single menu in the environment or the
+        # guilds file, copy it over once
+        if await self.db.get("role_menu_migrated") is not None:
+            return
+
+        if message_id is not None:
+            for emoji, role_id in mapping.items():
+                await self.add(message_id, emoji, role_id)
+
+        await self.db.set("role_menu_migrated", "1")
+
+
+class RoleEdits:
+    def __init__(self, window: float = 2.0):
+        self.window = window
+
+        # member id -> [member, {role id: True to add, False to remove}]
+        self.pending = {}
+        self.timer = None
+        self.edits = 0
+        self.collapsed = 0
+
+    def add(self, member: discord.Member, role_id, grant: bool) -> None:
+        entry = self.pending.get(member.id)
+        if entry is None:
+            entry = [member, {}]
+            self.pending[member.id] = entry
+        else:
+            # Keep the freshest Member, its roles are what the edit starts from
+            entry[0] = member
+            self.collapsed += 1
+
+        # The last reaction wins, an add followed by a remove cancels out
+        entry[1][role_id] = grant
+
+        if self.timer is None:
+            self.timer = asyncio.ensure_future(self.flush_later())
+
+    async def flush_later(self) -> None:
+        await asyncio.sleep(self.window)
+        self.timer = None
+
+        try:
+            await self.flush()
+        except Exception:
+            log.exception("Failed to edit roles")
+
+    async def flush(self) -> None:
+        pending = self.pending
+        self.pending = {}
+
+        for member, changes in pending.values():
+            await self.apply(member, changes)
+
+    async def apply(self, member: discord.Member, changes) -> None:
+        roles = {role.id: role for role in member.roles if not role.is_default()}
+        before = set(roles)
+
+        for role_id, grant in changes.items():
+            if grant:
+                roles.setdefault(role_id, discord.Object(id=role_id))
+            else:
+                roles.pop(role_id, None)
+
+        if set(roles) == before:
+            return
+
+        log.info("Updating roles of %s", member.name)
+        try:
+            await member.edit(roles=list(roles.values()), reason="Role menu")
+        except discord.HTTPException as e:
+            log.warning("Could not update roles of %s: %s", member.name, e)
+            return
+
+        self.edits += 1
+
+    def close(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
@@ -1,23 +1,72 @@
 import os
+import time
+import asyncio
+import logging
 import sqlite3
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from .essence import Essence, ClassProgress, UserClass
+from .metrics import DB_SECONDS, Timer
 
 
-SCHEMA_VERSION = "1"
+SCHEMA_VERSION = "2"
+
+# Width of the buckets the ledger is rolled up into for "points earned since"
+# queries, an hour keeps a week down to 168 rows per member and class.
+ROLLUP_SECONDS = 3600
+
+log = logging.getLogger(__name__)
 
 
 class Database:
-    def __init__(self):
+    def __init__(self, guild_id=None, pool=None):
         os.makedirs("guilds", exist_ok=True)
 
-        guild_id = os.getenv("GUILD_ID")
+        if guild_id is None:
+            guild_id = os.getenv("GUILD_ID")
+        self.guild_id = guild_id
         self.db_path = f"guilds/{guild_id}.db"
 
+        # Databases handed out by a DatabasePool open on first use and may be
+        # closed again once idle, standalone ones stay open until close().
+        self.pool = pool
+        self.executor = None
+        self.opened = None
+        self.conn = None
+        self.in_flight = 0
+        self.last_used = 0.0
+
+        # Receives every Essence written to the ledger, see leaderboard.py
+        self.leaderboard = None
+
+        # The last ledger entry folded into the classes and members snapshot
+        self.snapshot_id = 0
+
+        # Each write extends this session's row in the sessions table, which
+        # tells the history backfill which messages were already counted live
+        self.session_started = time.time()
+
+        if pool is None:
+            self.open().result()
+
+    def open(self):
+        if self.executor is None:
+            # Every sqlite3 call runs on this single thread, which keeps disk
+            # I/O off the event loop and serializes access to the connection.
+            self.executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix=f"sarica-db-{self.guild_id}"
+            )
+            self.opened = self.executor.submit(self.__open)
+
+        return self.opened
+
+    def __open(self):
+        self.conn = None
         try:
             self.conn = sqlite3.connect(self.db_path)
             self.cursor = self.conn.cursor()
         except sqlite3.OperationalError as e:
-            print(f"Error opening database: {e}", flush=True)
+            log.critical("Error opening database: %s", e)
             raise SystemExit
 
         self.cursor.execute(
@@ -34,65 +83,617 @@ class Database:
                 member_id INTEGER,
                 class_id INTEGER,
                 points INTEGER,
+                affinity REAL DEFAULT 0,
                 PRIMARY KEY (member_id, class_id)
             )
             """
         )
+        self.cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS members (
+                member_id INTEGER PRIMARY KEY,
+                exp INTEGER,
+                level INTEGER
+            )
+            """
+        )
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS classes_by_points ON classes (class_id, points)"
+        )
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS members_by_level ON members (level, exp)"
+        )
+        self.cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS ledger (
+                entry_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                time REAL,
+                member_id INTEGER,
+                class_id INTEGER,
+                points INTEGER,
+                channel_id INTEGER
+            )
+            """
+        )
+        self.cursor.execute(
+            "CREATE INDEX IF NOT EXISTS ledger_by_member ON ledger (member_id, entry_id)"
+        )
+        self.cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rollups (
+                bucket INTEGER,
+                member_id INTEGER,
+                class_id INTEGER,
+                points INTEGER,
+                PRIMARY KEY (bucket, member_id, class_id)
+            )
+            """
+        )
+        self.cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS feeds (
+                feed_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                url TEXT UNIQUE,
+                channel_id INTEGER,
+                role_id INTEGER,
+                footer TEXT,
+                etag TEXT,
+                last_modified TEXT,
+                primed INTEGER DEFAULT 0
+            )
+            """
+        )
+        self.cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS role_menus (
+                message_id INTEGER,
+                emoji_key TEXT,
+                role_id INTEGER,
+                PRIMARY KEY (message_id, emoji_key)
+            )
+            """
+        )
+        self.cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sessions (
+                started REAL PRIMARY KEY,
+                ended REAL
+            )
+            """
+        )
+        self.cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS feed_entries (
+                feed_id INTEGER,
+                guid TEXT,
+                PRIMARY KEY (feed_id, guid)
+            )
+            """
+        )
 
         self.conn.commit()
         self.update_schema()
+        self.snapshot_id = int(self.__get("snapshot_entry_id") or 0)
 
     def update_schema(self):
-        schema_version = self.get("schema_version")
+        schema_version = self.__get("schema_version")
 
         if schema_version == SCHEMA_VERSION:
             return
 
         if schema_version is None:
-            self.set("schema_version", SCHEMA_VERSION)
+            self.__set("schema_version", SCHEMA_VERSION)
             return
 
-        print(f"Unknown schema version: {schema_version}", flush=True)
+        if schema_version == "1":
+            self.__migrate_v1_to_v2()
+            self.__set("schema_version", "2")
+            return
+
+        log.critical("Unknown schema version: %s", schema_version)
         raise SystemExit
 
-    def get(self, key):
+    def __migrate_v1_to_v2(self):
+        # Version 1 only stored points, so rebuild each member the way
+        # get_essence used to and keep the resulting exp, level and affinities.
+        log.warning("Migrating database to schema version 2")
+        self.cursor.execute("ALTER TABLE classes ADD COLUMN affinity REAL DEFAULT 0")
+
+        self.cursor.execute(
+            "SELECT member_id, class_id, points FROM classes ORDER BY member_id, rowid"
+        )
+        essences = {}
+        for member_id, class_id, points in self.cursor.fetchall():
+            essence = essences.setdefault(member_id, Essence())
+            essence.add_points(UserClass(class_id), points)
+
+        for member_id, essence in essences.items():
+            member, classes = self.__essence_rows(member_id, essence)
+            self.__write_essence([member], classes)
+
+        self.conn.commit()
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        histogram = DB_SECONDS.labels(func.__name__.rpartition("__")[2])
+
+        self.in_flight += 1
+        try:
+            if self.pool is not None:
+                await self.pool.touch(self)
+
+            # Operations queue behind the open on the same thread
+            opened = self.open()
+
+            def timed():
+                with Timer(histogram):
+                    opened.result()
+                    return func(*args)
+
+            return await loop.run_in_executor(self.executor, timed)
+        finally:
+            self.in_flight -= 1
+            self.last_used = loop.time()
+
+    async def release(self):
+        # Only called by the pool while nothing is running, so the connection
+        # can be closed without blocking the event loop. A later operation
+        # simply opens a fresh connection on a new thread.
+        if self.executor is None:
+            return
+
+        executor = self.executor
+        conn = self.conn
+        self.executor = None
+        self.opened = None
+        self.conn = None
+
+        if conn is not None:
+            await asyncio.wrap_future(executor.submit(conn.close))
+        executor.shutdown(wait=False)
+
+    def close(self):
+        if self.executor is None:
+            return
+
+        self.executor.submit(self.__close).result()
+        self.executor.shutdown()
+        self.executor = None
+        self.opened = None
+
+    def __close(self):
+        if self.conn is None:
+            return
+
+        self.conn.close()
+        self.conn = None
+
+    async def get(self, key):
+        return await self.run(self.__get, key)
+
+    async def set(self, key, value):
+        await self.run(self.__set, key, value)
+
+    async def get_essence(self, member_id) -> Essence:
+        return await self.run(self.__get_essence, member_id)
+
+    async def write_ledger(self, entries, essences=(), config=None):
+        # Entries are (time, member_id, class_id, points, channel_id) rows,
+        # essences the cached members they were applied to.
+        if self.leaderboard is not None:
+            for member_id, essence in essences:
+                self.leaderboard.update(member_id, essence)
+
+        await self.run(self.__write_ledger, list(entries), config or {})
+
+    def __essence_rows(self, member_id, essence: Essence):
+        # Any award shifts every affinity, so a changed Essence writes all of
+        # its classes, not just the ones that gained points.
+        member = (member_id, essence.exp, essence.level)
+        classes = []
+        for progress in essence.get_class_list():
+            classes.append(
+                (
+                    member_id,
+                    progress.user_class.value,
+                    progress.points,
+                    progress.affinity,
+                )
+            )
+            progress.changed = False
+
+        essence.changed = False
+        return member, classes
+
+    async def add_points_bulk(
+        self, deltas, entries=(), essences=(), config=None, channel_id=None
+    ):
+        # Turns {member_id: {(UserClass, time): points}} for members that are
+        # not cached into ledger entries and writes them together with the given
+        # entries for cached members and any config keys in one transaction.
+        if self.leaderboard is not None:
+            for member_id, essence in essences:
+                self.leaderboard.update(member_id, essence)
+
+        loaded = await self.run(
+            self.__add_points_bulk, deltas, list(entries), config or {}, channel_id
+        )
+
+        if self.leaderboard is not None:
+            for member_id, essence in loaded:
+                self.leaderboard.update(member_id, essence)
+
+    async def compact(self, ledger_retention=None, rollup_retention=None):
+        # Folds new ledger entries into the snapshot, then drops folded
+        # entries and rollups older than the given number of seconds.
+        now = time.time()
+        ledger_before = now - ledger_retention if ledger_retention else None
+        rollup_before = now - rollup_retention if rollup_retention else None
+        return await self.run(self.__compact, ledger_before, rollup_before)
+
+    async def recompute_essences(self):
+        # Rebuilds exp, levels and affinities for every member from their
+        # class points, see recompute.py
+        return await self.run(self.__recompute_essences)
+
+    async def get_top_members_since(
+        self, since: float, user_class: UserClass = None, limit: int = 10
+    ):
+        class_id = user_class.value if user_class is not None else None
+        return await self.run(self.__get_top_members_since, since, class_id, limit)
+
+    async def get_sessions(self):
+        return await self.run(self.__get_sessions)
+
+    async def get_top_members(self, limit: int):
+        return await self.run(self.__get_top_members, limit)
+
+    async def get_top_class_members(self, user_class: UserClass, limit: int):
+        return await self.run(self.__get_top_class_members, user_class.value, limit)
+
+    async def get_role_menus(self):
+        return await self.run(self.__get_role_menus)
+
+    async def add_role_menu_entry(self, message_id, emoji_key: str, role_id):
+        await self.run(self.__add_role_menu_entry, message_id, emoji_key, role_id)
+
+    async def remove_role_menu_entries(self, message_id, emoji_key: str = None) -> int:
+        return await self.run(self.__remove_role_menu_entries, message_id, emoji_key)
+
+    async def get_feeds(self):
+        return await self.run(self.__get_feeds)
+
+    async def add_feed(self, url, channel_id, role_id=None, footer=None, seen=()):
+        return await self.run(self.__add_feed, url, channel_id, role_id, footer, seen)
+
+    async def remove_feed(self, url) -> bool:
+        return await self.run(self.__remove_feed, url)
+
+    async def update_feed(self, feed_id, etag, last_modified, guids):
+        await self.run(self.__update_feed, feed_id, etag, last_modified, guids)
+
+    def __get(self, key):
         self.cursor.execute("SELECT value FROM config WHERE key = ?", (key,))
         value = self.cursor.fetchone()
         if value is None:
             return None
         return value[0]
 
-    def set(self, key, value):
+    def __set(self, key, value):
         self.cursor.execute(
             "INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)", (key, value)
         )
         self.conn.commit()
 
-    def get_essence(self, member_id):
+    def __get_essence(self, member_id) -> Essence:
+        # The snapshot plus whatever was awarded since it was taken
+        essence = self.__get_snapshot(member_id)
+
+        self.cursor.execute(
+            "SELECT class_id, points FROM ledger WHERE member_id = ? AND entry_id > ? ORDER BY entry_id",
+            (member_id, self.snapshot_id),
+        )
+        for class_id, points in self.cursor.fetchall():
+            essence.add_points(UserClass(class_id), points)
+
+        essence.changed = False
+        return essence
+
+    def __get_snapshot(self, member_id) -> Essence:
         essence = Essence()
 
+        self.cursor.execute(
+            "SELECT exp, level FROM members WHERE member_id = ?", (member_id,)
+        )
         query = self.cursor.fetchone()
-        if query is not None:
-            essence.exp = query[0]
-            essence.level = query[1]
+        if query is None:
+            return essence
+
+        essence.exp = query[0]
+        essence.level = query[1]
 
         self.cursor.execute(
-            "SELECT class_id, points FROM classes WHERE member_id = ?", (member_id,)
+            "SELECT class_id, points, affinity FROM classes WHERE member_id = ?",
+            (member_id,),
         )
-        query = self.cursor.fetchall()
-        for class_id, points in query:
-            essence.add_points(UserClass(class_id), points)
+        for class_id, points, affinity in self.cursor.fetchall():
+            essence.restore_class(UserClass(class_id), points, affinity)
 
+        essence.sort_classes()
         return essence
 
-    def set_essence(self, member_id, essence: Essence):
-        for progress in essence.classes:
-            if not progress.changed:
-                continue
+    def __write_ledger(self, entries, config):
+        self.cursor.executemany(
+            "INSERT INTO ledger (time, member_id, class_id, points, channel_id) VALUES (?, ?, ?, ?, ?)",
+            entries,
+        )
 
+        rollups = {}
+        for when, member_id, class_id, points, _ in entries:
+            key = (int(when // ROLLUP_SECONDS) * ROLLUP_SECONDS, member_id, class_id)
+            rollups[key] = rollups.get(key, 0) + points
+
+        self.cursor.executemany(
+            """
+            INSERT INTO rollups (bucket, member_id, class_id, points) VALUES (?, ?, ?, ?)
+            ON CONFLICT (bucket, member_id, class_id) DO UPDATE SET points = points + excluded.points
+            """,
+            [key + (points,) for key, points in rollups.items()],
+        )
+        self.cursor.executemany(
+            "INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)",
+            list(config.items()),
+        )
+        self.__extend_session()
+        self.conn.commit()
+
+    def __add_points_bulk(self, deltas, entries, config, channel_id):
+        essences = []
+        for member_id, points in deltas.items():
+            essence = self.__get_essence(member_id)
+            for (user_class, when), amount in points.items():
+                essence.add_points(user_class, amount)
+                entries.append((when, member_id, user_class.value, amount, channel_id))
+
+            essences.append((member_id, essence))
+
+        self.__write_ledger(entries, config)
+        return essences
+
+    def __compact(self, ledger_before, rollup_before):
+        self.cursor.execute("SELECT MAX(entry_id) FROM ledger")
+        last_id = max(self.cursor.fetchone()[0] or 0, self.snapshot_id)
+
+        folded = 0
+        if last_id > self.snapshot_id:
             self.cursor.execute(
-                "INSERT OR REPLACE INTO classes (member_id, class_id, points) VALUES (?, ?, ?)",
-                (member_id, progress.user_class.value, progress.points),
+                "SELECT member_id, class_id, points FROM ledger WHERE entry_id > ? AND entry_id <= ? ORDER BY entry_id",
+                (self.snapshot_id, last_id),
+            )
+            essences = {}
+            for member_id, class_id, points in self.cursor.fetchall():
+                essence = essences.get(member_id)
+                if essence is None:
+                    essence = self.__get_snapshot(member_id)
+                    essences[member_id] = essence
+
+                essence.add_points(UserClass(class_id), points)
+                folded += 1
+
+            members = []
+            classes = []
+            for member_id, essence in essences.items():
+                member, rows = self.__essence_rows(member_id, essence)
+                members.append(member)
+                classes.extend(rows)
+
+            self.__write_essence(members, classes)
+            self.cursor.execute(
+                "INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)",
+                ("snapshot_entry_id", str(last_id)),
+            )
+
+        # Only entries already in the snapshot may go
+        pruned = 0
+        if ledger_before is not None:
+            self.cursor.execute(
+                "DELETE FROM ledger WHERE entry_id <= ? AND time < ?",
+                (last_id, ledger_before),
+            )
+            pruned = self.cursor.rowcount
+
+        if rollup_before is not None:
+            self.cursor.execute(
+                "DELETE FROM rollups WHERE bucket < ?",
+                (int(rollup_before // ROLLUP_SECONDS) * ROLLUP_SECONDS,),
             )
 
         self.conn.commit()
+        self.snapshot_id = last_id
+        return folded, pruned
+
+    def __extend_session(self):
+        self.cursor.execute(
+            "INSERT OR REPLACE INTO sessions (started, ended) VALUES (?, ?)",
+            (self.session_started, time.time()),
+        )
+
+    def __get_sessions(self):
+        self.cursor.execute("SELECT started, ended FROM sessions ORDER BY started")
+        return self.cursor.fetchall()
+
+    def __write_essence(self, members, classes):
+        self.cursor.executemany(
+            "INSERT OR REPLACE INTO members (member_id, exp, level) VALUES (?, ?, ?)",
+            members,
+        )
+        self.cursor.executemany(
+            "INSERT OR REPLACE INTO classes (member_id, class_id, points, affinity) VALUES (?, ?, ?, ?)",
+            classes,
+        )
+
+    def __get_top_members(self, limit: int):
+        self.cursor.execute(
+            "SELECT member_id, level, exp FROM members ORDER BY level DESC, exp DESC LIMIT ?",
+            (limit,),
+        )
+        return self.cursor.fetchall()
+
+    def __get_top_class_members(self, class_id: int, limit: int):
+        self.cursor.execute(
+            "SELECT member_id, points FROM classes WHERE class_id = ? ORDER BY points DESC LIMIT ?",
+            (class_id, limit),
+        )
+        return self.cursor.fetchall()
+
+    def __recompute_essences(self):
+        # NumPy is only needed here, keep it out of startup
+        from .recompute import Recomputed
+
+        self.__compact(None, None)
+
+        self.cursor.execute(
+            "SELECT member_id, class_id, points, COALESCE(affinity, 0) FROM classes"
+        )
+        classes = self.cursor.fetchall()
+        self.cursor.execute("SELECT member_id, exp, level FROM members")
+        recomputed = Recomputed(classes, self.cursor.fetchall())
+
+        self.__write_essence(recomputed.member_rows(), recomputed.class_rows())
+        self.conn.commit()
+        return recomputed
+
+    def __get_top_members_since(self, since: float, class_id, limit: int):
+        # The bucket holding since is counted whole
+        bucket = int(since // ROLLUP_SECONDS) * ROLLUP_SECONDS
+        if class_id is None:
+            self.cursor.execute(
+                "SELECT member_id, SUM(points) AS total FROM rollups WHERE bucket >= ? GROUP BY member_id ORDER BY total DESC LIMIT ?",
+                (bucket, limit),
+            )
+        else:
+            self.cursor.execute(
+                "SELECT member_id, SUM(points) AS total FROM rollups WHERE bucket >= ? AND class_id = ? GROUP BY member_id ORDER BY total DESC LIMIT ?",
+                (bucket, class_id, limit),
+            )
+        return self.cursor.fetchall()
+
+    def __get_role_menus(self):
+        self.cursor.execute("SELECT message_id, emoji_key, role_id FROM role_menus")
+        return self.cursor.fetchall()
+
+    def __add_role_menu_entry(self, message_id, emoji_key, role_id):
+        self.cursor.execute(
+            "INSERT OR REPLACE INTO role_menus (message_id, emoji_key, role_id) VALUES (?, ?, ?)",
+            (message_id, emoji_key, role_id),
+        )
+        self.conn.commit()
+
+    def __remove_role_menu_entries(self, message_id, emoji_key) -> int:
+        if emoji_key is None:
+            self.cursor.execute(
+                "DELETE FROM role_menus WHERE message_id = ?", (message_id,)
+            )
+        else:
+            self.cursor.execute(
+                "DELETE FROM role_menus WHERE message_id = ? AND emoji_key = ?",
+                (message_id, emoji_key),
+            )
+        removed = self.cursor.rowcount
+        self.conn.commit()
+        return removed
+
+    def __get_feeds(self):
+        self.cursor.execute(
+            "SELECT feed_id, url, channel_id, role_id, footer, etag, last_modified, primed FROM feeds"
+        )
+        feeds = self.cursor.fetchall()
+
+        seen = {}
+        self.cursor.execute("SELECT feed_id, guid FROM feed_entries")
+        for feed_id, guid in self.cursor.fetchall():
+            seen.setdefault(feed_id, set()).add(guid)
+
+        return feeds, seen
+
+    def __add_feed(self, url, channel_id, role_id, footer, seen):
+        self.cursor.execute(
+            "INSERT INTO feeds (url, channel_id, role_id, footer, primed) VALUES (?, ?, ?, ?, ?)",
+            (url, channel_id, role_id, footer, 1 if len(seen) > 0 else 0),
+        )
+        feed_id = self.cursor.lastrowid
+        self.cursor.executemany(
+            "INSERT OR IGNORE INTO feed_entries (feed_id, guid) VALUES (?, ?)",
+            [(feed_id, guid) for guid in seen],
+        )
+        self.conn.commit()
+        return feed_id
+
+    def __remove_feed(self, url) -> bool:
+        self.cursor.execute("SELECT feed_id FROM feeds WHERE url = ?", (url,))
+        query = self.cursor.fetchone()
+        if query is None:
+            return False
+
+        self.cursor.execute("DELETE FROM feeds WHERE feed_id = ?", query)
+        self.cursor.execute("DELETE FROM feed_entries WHERE feed_id = ?", query)
+        self.conn.commit()
+        return True
+
+    def __update_feed(self, feed_id, etag, last_modified, guids):
+        self.cursor.execute(
+            "UPDATE feeds SET etag = ?, last_modified = ?, primed = 1 WHERE feed_id = ?",
+            (etag, last_modified, feed_id),
+        )
+        self.cursor.executemany(
+            "INSERT OR IGNORE INTO feed_entries (feed_id, guid) VALUES (?, ?)",
+            [(feed_id, guid) for guid in guids],
+        )
+        self.conn.commit()
+
+
+class DatabasePool:
+    def __init__(self, max_open: int = 8, idle_timeout: float = 300):
+        self.max_open = max_open
+        self.idle_timeout = idle_timeout
+        self.databases = {}
+        self.open = OrderedDict()
+
+    def get(self, guild_id) -> Database:
+        db = self.databases.get(guild_id)
+        if db is None:
+            db = Database(guild_id, pool=self)
+            self.databases[guild_id] = db
+        return db
+
+    async def touch(self, db: Database) -> None:
+        self.open[db.guild_id] = db
+        self.open.move_to_end(db.guild_id)
+
+        if len(self.open) <= self.max_open:
+            return
+
+        # Close the least recently used databases that are not busy. If every
+        # one of them is busy the pool runs over its limit until the next call.
+        for guild_id, other in list(self.open.items()):
+            if len(self.open) <= self.max_open:
+                break
+            if other is db or other.in_flight > 0 or guild_id not in self.open:
+                continue
+
+            del self.open[guild_id]
+            await other.release()
+
+    async def close_idle(self) -> None:
+        cutoff = asyncio.get_running_loop().time() - self.idle_timeout
+        for guild_id, db in list(self.open.items()):
+            if db.in_flight > 0 or db.last_used > cutoff or guild_id not in self.open:
+                continue
+
+            del self.open[guild_id]
+            await db.release()
+
+    def close(self) -> None:
+        for db in self.databases.values():
+            db.close()
+        self.open.clear()
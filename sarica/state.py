@@ -0,0 +1,75 @@
+import os
+import aiohttp
+import discord
+from .sql import Database
+from .cache import EssenceCache, CardCache
+from .leaderboard import Leaderboard
+from .subscriptions import FeedSubscriptions
+from .welcome import WelcomeQueue
+from .awards import AwardAccumulator
+from .roles import RoleMenus, RoleEdits
+from .guild import GuildConfig
+
+
+# Everything a guild holds while the bot runs. This is not hot reloaded, live
+# instances would keep their old attributes, see reload.py
+class GuildState:
+    def __init__(
+        self,
+        config: GuildConfig,
+        db: Database,
+        session: aiohttp.ClientSession,
+        send_welcome,
+    ):
+        self.config = config
+        self.guild = discord.Object(id=config.guild_id)
+        self.db = db
+        self.essences = EssenceCache(
+            db,
+            max_size=int(os.getenv("ESSENCE_CACHE_SIZE", "1024")),
+            flush_threshold=int(os.getenv("ESSENCE_FLUSH_THRESHOLD", "64")),
+        )
+        self.awards = AwardAccumulator(
+            self.essences,
+            window=float(os.getenv("AWARD_WINDOW", "10")),
+            cap=int(os.getenv("AWARD_CAP", "0")),
+            cap_window=float(os.getenv("AWARD_CAP_WINDOW", "60")),
+        )
+        self.cards = CardCache(max_size=int(os.getenv("CARD_CACHE_SIZE", "256")))
+        self.leaderboard = Leaderboard(
+            db, size=int(os.getenv("LEADERBOARD_SIZE", "10"))
+        )
+        self.feeds = FeedSubscriptions(db, session)
+        self.role_menus = RoleMenus(db)
+        self.role_edits = RoleEdits(window=float(os.getenv("ROLE_EDIT_WINDOW", "2")))
+
+        # Joins are welcomed in batches, fetched once and kept for every batch
+        self.wave_sticker = None
+        self.welcomes = WelcomeQueue(
+            lambda members: send_welcome(self, members),
+            window=float(os.getenv("WELCOME_WINDOW", "5")),
+            max_members=int(os.getenv("WELCOME_MAX_MEMBERS", "20")),
+        )
+
+        # The history backfill running for this guild, one at a time
+        self.backfill = None
+
+    async def load(self) -> None:
+        # Fold what was awarded since the last snapshot so the leaderboard
+        # and later loads only replay entries from this session
+        await self.db.compact()
+        await self.leaderboard.load()
+        self.db.leaderboard = self.leaderboard
+
+        await self.role_menus.load()
+        await self.role_menus.migrate_config(
+            self.config.role_message_id, self.config.role_mapping
+        )
+
+        await self.feeds.load()
+        if self.config.migrate_rr_feed and self.config.announcements_channel_id:
+            await self.feeds.migrate_rr_feed(
+                self.config.announcements_channel_id,
+                self.config.updates_role_id,
+                self.config.feed_footer,
+            )
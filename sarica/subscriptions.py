@@ -0,0 +1,173 @@
+import random
+import logging
+import asyncio
+import aiohttp
+from typing import List, Tuple
+from . import feed
+from .sql import Database
+
+
+log = logging.getLogger(__name__)
+
+
+# The live polling state of a guild's feeds, kept out of feed.py so that
+# module can be hot reloaded
+class Subscription:
+    def __init__(
+        self,
+        feed_id,
+        url,
+        channel_id,
+        role_id=None,
+        footer=None,
+        etag=None,
+        last_modified=None,
+        primed=False,
+        seen=None,
+    ):
+        self.feed_id = feed_id
+        self.url = url
+        self.channel_id = channel_id
+        self.role_id = role_id
+        self.footer = footer
+        self.etag = etag
+        self.last_modified = last_modified
+        self.primed = primed
+        self.seen = seen if seen is not None else set()
+
+        self.failures = 0
+        self.next_poll = 0
+
+
+class FeedSubscriptions:
+    def __init__(
+        self,
+        db: Database,
+        session: aiohttp.ClientSession,
+        interval=600,
+        max_backoff=6 * 60 * 60,
+        concurrency=8,
+        timeout=30,
+    ):
+        self.db = db
+        self.session = session
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.subscriptions = {}
+
+    async def load(self) -> None:
+        feeds, seen = await self.db.get_feeds()
+        self.subscriptions = {}
+
+        for feed_id, url, channel_id, role_id, footer, etag, modified, primed in feeds:
+            self.subscriptions[url] = Subscription(
+                feed_id,
+                url,
+                channel_id,
+                role_id,
+                footer,
+                etag,
+                modified,
+                primed == 1,
+                seen.get(feed_id, set()),
+            )
+
+    async def subscribe(self, url, channel_id, role_id=None, footer=None, seen=()):
+        if url in self.subscriptions:
+            return None
+
+        seen = set(seen)
+        feed_id = await self.db.add_feed(url, channel_id, role_id, footer, seen)
+        sub = Subscription(
+            feed_id, url, channel_id, role_id, footer, primed=len(seen) > 0, seen=seen
+        )
+        self.subscriptions[url] = sub
+        return sub
+
+    async def unsubscribe(self, url) -> bool:
+        self.subscriptions.pop(url, None)
+        return await self.db.remove_feed(url)
+
+    async def migrate_rr_feed(self, channel_id, role_id, footer=None) -> None:
+        # Older versions tracked a single Royal Road feed in the config table
+        if await self.db.get("rr_feed_subscribed") is not None:
+            return
+
+        latest_chapter_id = await self.db.get("latest_chapter_id")
+        seen = [] if latest_chapter_id is None else [latest_chapter_id]
+
+        await self.subscribe(feed.get_rr_feed_url(), channel_id, role_id, footer, seen)
+        await self.db.set("rr_feed_subscribed", "1")
+
+    async def poll(self) -> List[Tuple[Subscription, object]]:
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+
+        due = [s for s in self.subscriptions.values() if s.next_poll <= now]
+        results = await asyncio.gather(*[self.poll_feed(s) for s in due])
+        return [(sub, entry) for sub, entries in zip(due, results) for entry in entries]
+
+    async def poll_feed(self, sub: Subscription) -> list:
+        # A failing feed only backs off itself, the others keep polling
+        try:
+            return await self.check_feed(sub)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.backoff(sub)
+            log.warning(
+                "Failed to fetch feed %s (%d failures): %r",
+                sub.url,
+                sub.failures,
+                e,
+            )
+        except Exception:
+            self.backoff(sub)
+            log.exception("Failed to poll feed %s (%d failures)", sub.url, sub.failures)
+
+        return []
+
+    async def check_feed(self, sub: Subscription) -> list:
+        async with self.semaphore:
+            parsed, etag, last_modified = await feed.fetch_feed(
+                self.session, sub.url, sub.etag, sub.last_modified, self.timeout
+            )
+
+        sub.failures = 0
+        sub.next_poll = 0
+
+        if parsed is None:
+            return []
+
+        # Feeds list the newest entries first, everything before the first
+        # entry we have already seen is new.
+        new_entries = []
+        for entry in parsed.entries:
+            entry_id = feed.get_entry_id(entry)
+            if entry_id in sub.seen:
+                break
+
+            new_entries.append(entry)
+
+        guids = [feed.get_entry_id(e) for e in new_entries]
+        await self.db.update_feed(sub.feed_id, etag, last_modified, guids)
+
+        sub.etag = etag
+        sub.last_modified = last_modified
+        sub.seen.update(guids)
+
+        # A newly added feed only records what is already there
+        if not sub.primed:
+            sub.primed = True
+            return []
+
+        new_entries.reverse()
+        return new_entries
+
+    def backoff(self, sub: Subscription) -> None:
+        sub.failures += 1
+        delay = min(self.interval * (2 ** (sub.failures - 1)), self.max_backoff)
+        delay *= random.uniform(0.5, 1.0)
+
+        loop = asyncio.get_running_loop()
+        sub.next_poll = loop.time() + delay
@@ -1,49 +1,67 @@
 from typing import List, Optional
-from prettytable import PrettyTable, TableStyle
+from wcwidth import wcswidth
+
+
+def text_width(text: str) -> int:
+    return wcswidth(text)
+
+
+def center(text: str, width: int) -> str:
+    # Matches PrettyTable's centering, which puts the odd space on the right
+    # for odd width text and on the left for even width text.
+    text_len = text_width(text)
+    excess = width - text_len
+    left = excess // 2
+    right = excess // 2
+
+    if excess % 2:
+        if text_len % 2:
+            right += 1
+        else:
+            left += 1
+
+    return " " * left + text + " " * right
 
 
 def make_table(rows: List[List[str]], header: Optional[List[str]] = None):
-    table = PrettyTable()
-    table.set_style(TableStyle.SINGLE_BORDER)
+    rows = [[str(cell) for cell in row] for row in rows]
 
     if header is not None:
-        table.header = True
-        table.field_names = header
+        widths = [text_width(str(cell)) for cell in header]
+    elif len(rows) > 0:
+        widths = [0] * len(rows[0])
     else:
-        table.header = False
+        return ""
 
     for row in rows:
-        table.add_row(row, divider=True)
-
-    text = str(table)
-
-    x = 0
-    y = 0
-    w = text.index("\n") - 1
-    h = len(rows) * 2 + (2 if header is not None else 0)
-
-    for i, c in enumerate(text):
-        if c == "\n":
-            x = 0
-            y += 1
-            continue
-
-        if x == 0 and y == 0:
-            text = text[:i] + "╔" + text[i + 1 :]
-        elif x == 0 and y == h:
-            text = text[:i] + "╚" + text[i + 1 :]
-        elif x == w and y == 0:
-            text = text[:i] + "╗" + text[i + 1 :]
-        elif x == w and y == h:
-            text = text[:i] + "╝" + text[i + 1 :]
-        elif x == 0:
-            text = text[:i] + "║" + text[i + 1 :]
-        elif x == w:
-            text = text[:i] + "║" + text[i + 1 :]
-        elif y == 0:
-            text = text[:i] + "═" + text[i + 1 :]
-        elif y == h:
-            text = text[:i] + "═" + text[i + 1 :]
-
-        x += 1
-    return text
+        for i, cell in enumerate(row):
+            widths[i] = max(widths[i], text_width(cell))
+
+    # The outer border is double-lined and the inner borders single-lined.
+    # The right border is placed by character index, the same as the old
+    # PrettyTable post-processing did, so rows containing wide characters
+    # keep a single-lined right edge.
+    w = sum(widths) + 2 * len(widths) + len(widths)
+    divider = "║" + "┼".join("─" * (width + 2) for width in widths) + "║"
+
+    def render_row(cells):
+        line = (
+            "║ " + " │ ".join(center(c, widths[i]) for i, c in enumerate(cells)) + " │"
+        )
+        if len(line) > w:
+            return line[:w] + "║" + line[w + 1 :]
+        return line
+
+    lines = ["╔" + "═" * (w - 1) + "╗"]
+
+    if header is not None:
+        lines.append(render_row([str(cell) for cell in header]))
+        lines.append(divider)
+
+    for i, row in enumerate(rows):
+        if i > 0:
+            lines.append(divider)
+        lines.append(render_row(row))
+
+    lines.append("╚" + "═" * (w - 1) + "╝")
+    return "\n".join(lines)
@@ -0,0 +1,56 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, List
+
+
+log = logging.getLogger(__name__)
+
+
+def join_mentions(mentions: List[str]) -> str:
+    if len(mentions) <= 1:
+        return "".join(mentions)
+
+    return ", ".join(mentions[:-1]) + " and " + mentions[-1]
+
+
+class WelcomeQueue:
+    def __init__(
+        self,
+        send: Callable[[list], Awaitable[None]],
+        window: float = 5.0,
+        max_members: int = 20,
+    ):
+        self.send = send
+        self.window = window
+        self.max_members = max_members
+        self.pending = []
+        self.timer = None
+
+    async def add(self, member) -> None:
+        self.pending.append(member)
+
+        # A full batch goes out right away, otherwise wait for more joins
+        if len(self.pending) >= self.max_members:
+            await self.flush()
+        elif self.timer is None:
+            self.timer = asyncio.ensure_future(self.flush_later())
+
+    async def flush_later(self) -> None:
+        await asyncio.sleep(self.window)
+        self.timer = None
+
+        try:
+            await self.flush()
+        except Exception:
+            log.exception("Failed to send welcome message")
+
+    async def flush(self) -> None:
+        while len(self.pending) > 0:
+            batch = self.pending[: self.max_members]
+            del self.pending[: self.max_members]
+            await self.send(batch)
+
+    def close(self) -> None:
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
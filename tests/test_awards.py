@@ -0,0 +1,53 @@
+import asyncio
+import pytest
+from sarica.awards import AwardAccumulator
+from sarica.essence import UserClass
+
+
+class FlakyEssences:
+    def __init__(self, fail_on):
+        self.fail_on = fail_on
+        self.points = {}
+
+    async def add_points(self, member_id, user_class, points, channel_id=None):
+        if (member_id, user_class) == self.fail_on:
+            self.fail_on = None
+            raise RuntimeError("database is locked")
+
+        key = (member_id, user_class, channel_id)
+        self.points[key] = self.points.get(key, 0) + points
+
+
+def test_failed_apply_keeps_unapplied_awards():
+    essences = FlakyEssences(fail_on=(101, UserClass.Reader))
+
+    async def run():
+        awards = AwardAccumulator(essences, window=60)
+        await awards.add(100, UserClass.Reader, 5, 1)
+        await awards.add(101, UserClass.Social_Butterfly, 1, 1)
+        await awards.add(101, UserClass.Reader, 3, 1)
+        await awards.add(101, UserClass.Reactionary, 2, 1)
+        await awards.add(102, UserClass.Reader, 7, 1)
+
+        with pytest.raises(RuntimeError):
+            await awards.flush()
+
+        # Only what was not applied is pending again
+        assert awards.pending == {
+            101: {(UserClass.Reader, 1): 3, (UserClass.Reactionary, 1): 2},
+            102: {(UserClass.Reader, 1): 7},
+        }
+
+        await awards.add(102, UserClass.Reader, 1, 1)
+        await awards.flush()
+        awards.close()
+        assert awards.pending == {}
+
+    asyncio.run(run())
+    assert essences.points == {
+        (100, UserClass.Reader, 1): 5,
+        (101, UserClass.Social_Butterfly, 1): 1,
+        (101, UserClass.Reader, 1): 3,
+        (101, UserClass.Reactionary, 1): 2,
+        (102, UserClass.Reader, 1): 8,
+    }
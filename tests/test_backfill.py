@@ -0,0 +1,133 @@
+import asyncio
+from datetime import datetime, timezone
+from types import SimpleNamespace
+import pytest
+from sarica.backfill import Backfill
+from sarica.cache import EssenceCache
+from sarica.essence import UserClass
+from sarica.sql import Database
+
+
+BOT_ID = 1
+CHANNEL_ID = 10
+
+
+def make_message(message_id, author_id, timestamp):
+    return SimpleNamespace(
+        id=message_id,
+        author=SimpleNamespace(id=author_id),
+        channel=SimpleNamespace(id=CHANNEL_ID),
+        created_at=datetime.fromtimestamp(timestamp, timezone.utc),
+        stickers=[],
+    )
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = Database(guild_id=1)
+    yield db
+    db.close()
+
+
+def add_session(db, started, ended):
+    def insert():
+        db.conn.execute(
+            "INSERT INTO sessions (started, ended) VALUES (?, ?)", (started, ended)
+        )
+        db.conn.commit()
+
+    # The connection belongs to the database's own thread
+    db.executor.submit(insert).result()
+
+
+def run_backfill(db, messages, tracked_since=None):
+    state = SimpleNamespace(
+        db=db,
+        essences=EssenceCache(db),
+        config=SimpleNamespace(reward_rules={}),
+    )
+
+    async def history(channel, after):
+        for message in messages:
+            if after is None or message.id > after:
+                yield message
+
+    async def run():
+        backfill = Backfill(state, BOT_ID, history, tracked_since=tracked_since)
+        await backfill.run([SimpleNamespace(id=CHANNEL_ID)])
+        points = {}
+        for member_id in {m.author.id for m in messages}:
+            essence = await db.get_essence(member_id)
+            points[member_id] = essence.points[UserClass.Social_Butterfly.value]
+        return backfill, points
+
+    return asyncio.run(run())
+
+
+def test_history_before_sessions_were_recorded_is_skipped(db):
+    # An established guild, the bot joined long before sessions were recorded
+    # and was awarding live all that time
+    now = db.session_started
+    joined = now - 10_000
+    add_session(db, now - 2_000, now - 1_000)
+
+    messages = [
+        make_message(1, 100, joined - 500),  # before the bot joined
+        make_message(2, 101, joined + 100),  # counted live, not recorded
+        make_message(3, 101, now - 3_000),  # counted live, not recorded
+        make_message(4, 101, now - 1_500),  # counted live in a recorded session
+        make_message(5, 102, now - 500),  # the bot was offline
+        make_message(6, BOT_ID, now - 400),
+    ]
+    backfill, points = run_backfill(db, messages, tracked_since=joined)
+
+    assert backfill.scanned == 6
+    assert backfill.skipped == 4
+    assert backfill.awarded == 2
+    assert points == {100: 1, 101: 0, 102: 1, BOT_ID: 0}
+
+
+def test_first_backfill_without_recorded_sessions(db):
+    now = db.session_started
+    joined = now - 10_000
+    messages = [make_message(i, 100, joined + i * 100) for i in range(1, 10)]
+
+    backfill, points = run_backfill(db, messages, tracked_since=joined)
+    assert backfill.awarded == 0
+    assert points == {100: 0}
+
+
+def test_tracked_since_after_recorded_sessions(db):
+    now = db.session_started
+    add_session(db, now - 2_000, now - 1_000)
+    messages = [make_message(1, 100, now - 3_000), make_message(2, 100, now - 500)]
+
+    backfill, points = run_backfill(db, messages, tracked_since=now - 1_500)
+    assert backfill.awarded == 2
+    assert points == {100: 2}
+
+
+def test_resume_skips_checkpointed_messages(db):
+    now = db.session_started
+    messages = [make_message(i, 100, now - 5_000 + i) for i in range(1, 6)]
+
+    backfill, points = run_backfill(db, messages)
+    assert backfill.awarded == 5
+
+    again, points = run_backfill(db, messages)
+    assert again.scanned == 0
+    assert points == {100: 5}
+
+
+def test_old_history_stays_off_the_weekly_board(db):
+    now = db.session_started
+    year_ago = now - 365 * 24 * 3600
+    messages = [make_message(i, 100, year_ago + i * 60) for i in range(1, 51)]
+    messages.append(make_message(51, 101, now - 600))
+
+    backfill, points = run_backfill(db, messages)
+    assert points == {100: 50, 101: 1}
+
+    weekly = asyncio.run(db.get_top_members_since(now - 7 * 24 * 3600))
+    assert weekly == [(101, 1)]
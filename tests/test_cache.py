@@ -0,0 +1,76 @@
+import asyncio
+import sqlite3
+import pytest
+from sarica.cache import EssenceCache
+from sarica.essence import UserClass
+from sarica.sql import Database
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = Database(guild_id=1)
+    yield db
+    db.close()
+
+
+def fail_once(db, monkeypatch):
+    write_ledger = db.write_ledger
+    calls = []
+
+    async def flaky(*args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise sqlite3.OperationalError("database is locked")
+        return await write_ledger(*args, **kwargs)
+
+    monkeypatch.setattr(db, "write_ledger", flaky)
+    return calls
+
+
+def test_failed_flush_keeps_points(db, monkeypatch):
+    fail_once(db, monkeypatch)
+
+    async def run():
+        cache = EssenceCache(db, max_size=1, flush_threshold=100)
+        await cache.add_points(100, UserClass.Reader, 500)
+
+        with pytest.raises(sqlite3.OperationalError):
+            await cache.flush()
+
+        assert cache.dirty == {100}
+        assert len(cache.entries) == 1
+
+        # Loading another member evicts the first, which flushes it again
+        await cache.add_points(101, UserClass.Reader, 5)
+        assert 100 not in cache.essences
+
+        essence = await cache.get(100)
+        return essence.points[UserClass.Reader.value]
+
+    assert asyncio.run(run()) == 500
+
+
+def test_failed_flush_keeps_later_points(db, monkeypatch):
+    fail_once(db, monkeypatch)
+
+    async def run():
+        cache = EssenceCache(db, flush_threshold=100)
+        await cache.add_points(100, UserClass.Reader, 500)
+        with pytest.raises(sqlite3.OperationalError):
+            await cache.flush()
+
+        await cache.add_points(100, UserClass.Reader, 20)
+        await cache.add_points(102, UserClass.Reader, 7)
+        await cache.flush()
+        assert cache.dirty == set()
+        assert cache.entries == []
+
+        first = await db.get_essence(100)
+        second = await db.get_essence(102)
+        return (
+            first.points[UserClass.Reader.value],
+            second.points[UserClass.Reader.value],
+        )
+
+    assert asyncio.run(run()) == (520, 7)
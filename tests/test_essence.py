@@ -0,0 +1,124 @@
+import math
+import random
+import pytest
+from sarica.essence import (
+    MAX_LEVEL,
+    TOTAL_EXP,
+    Essence,
+    Path,
+    Realm,
+    RealmProgress,
+    Stage,
+    UserClass,
+)
+
+
+def legacy_exp_to_next(level: int) -> int:
+    return math.floor(math.pow(10 * (level + 1), 1.5) * 3)
+
+
+def legacy_add_gain(level: int, exp: int, value: int):
+    # Essence.__add_exp before it used TOTAL_EXP, for gains only
+    exp += value
+    while True:
+        needed = legacy_exp_to_next(level)
+        if exp < needed:
+            break
+
+        exp -= needed
+        level += 1
+
+    return min(level, 244), exp
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_gains_match_legacy_loop(seed):
+    rng = random.Random(seed)
+    essence = Essence()
+    level, exp = 0, 0
+
+    for _ in range(200):
+        value = rng.choice(
+            [rng.randint(0, 10), rng.randint(0, 1000), rng.randint(0, 100_000)]
+        )
+        essence.add_points(UserClass.Social_Butterfly, value)
+        level, exp = legacy_add_gain(level, exp, value)
+
+        assert (essence.level, essence.exp) == (level, exp)
+
+
+def test_gain_overshooting_level_cap():
+    for value in [
+        TOTAL_EXP[MAX_LEVEL],
+        TOTAL_EXP[MAX_LEVEL + 1] - 1,
+        TOTAL_EXP[MAX_LEVEL + 1],
+        TOTAL_EXP[MAX_LEVEL + 1] * 3 + 12345,
+    ]:
+        essence = Essence()
+        essence.add_points(UserClass.Reader, value)
+
+        assert (essence.level, essence.exp) == legacy_add_gain(0, 0, value)
+        assert essence.level == MAX_LEVEL
+
+
+def test_gain_past_cap_from_capped_member():
+    essence = Essence()
+    essence.add_points(UserClass.Reader, TOTAL_EXP[MAX_LEVEL])
+    level, exp = essence.level, essence.exp
+
+    essence.add_points(UserClass.Reader, 10_000_000)
+    assert (essence.level, essence.exp) == legacy_add_gain(level, exp, 10_000_000)
+
+
+@pytest.mark.parametrize("level", range(MAX_LEVEL + 1))
+def test_level_tables_match_formulas(level):
+    essence = Essence()
+    essence.add_points(UserClass.Reader, TOTAL_EXP[level])
+    assert essence.level == level
+
+    assert essence.get_realm() == Realm((level - 1) // 27)
+    assert essence.get_realm_progress() == RealmProgress(((level - 1) // 9) % 3)
+    assert essence.get_stage() == Stage((level - 1) // 9)
+    assert essence.get_step() == ((level - 1) % 9) + 1
+    assert essence.get_path() == Path((level - 1) // 81)
+    assert essence.exp_to_next() == legacy_exp_to_next(level)
+
+
+def test_omniscience_stage():
+    # Omniscience used to share Unity's value, so these levels had no stage
+    assert Stage.Omniscience.value == 24
+    assert len({stage.value for stage in Stage}) == len(Stage)
+
+    for level in range(217, 226):
+        essence = Essence()
+        essence.add_points(UserClass.Reader, TOTAL_EXP[level])
+        assert essence.get_stage() == Stage.Omniscience
+        assert essence.get_realm() == Realm.Transcendent
+
+
+def test_loss_drops_to_lower_level():
+    # The old loop reset any negative balance to level 0, a loss now keeps
+    # the exp that is left over
+    essence = Essence()
+    essence.add_points(UserClass.Reader, TOTAL_EXP[10] + 50)
+    essence.add_points(UserClass.Reader, -100)
+
+    total = TOTAL_EXP[10] + 50 - 100
+    assert essence.level == 9
+    assert essence.exp == total - TOTAL_EXP[9]
+
+
+def test_loss_within_level():
+    essence = Essence()
+    essence.add_points(UserClass.Reader, TOTAL_EXP[10] + 50)
+    essence.add_points(UserClass.Reader, -20)
+
+    assert (essence.level, essence.exp) == (10, 30)
+
+
+def test_loss_below_zero_clamps():
+    essence = Essence()
+    essence.add_points(UserClass.Reader, TOTAL_EXP[3] + 5)
+    essence.add_points(UserClass.Reader, -(TOTAL_EXP[3] + 100))
+
+    assert (essence.level, essence.exp) == (0, 0)
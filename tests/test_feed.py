@@ -0,0 +1,61 @@
+import asyncio
+import aiohttp
+from aiohttp import web
+from sarica import feed
+
+
+ETAG = '"v1"'
+LAST_MODIFIED = "Sat, 17 Oct 2026 12:00:00 GMT"
+BODY = b"<rss><channel><item><guid>1</guid></item></channel></rss>"
+
+
+def test_conditional_get(monkeypatch):
+    requests = []
+    parsed = []
+
+    async def serve_feed(request):
+        requests.append(dict(request.headers))
+        if request.headers.get("If-None-Match") == ETAG:
+            return web.Response(status=304)
+
+        return web.Response(
+            body=BODY,
+            content_type="application/rss+xml",
+            headers={"ETag": ETAG, "Last-Modified": LAST_MODIFIED},
+        )
+
+    def parse_feed(body):
+        parsed.append(body)
+        return "parsed"
+
+    monkeypatch.setattr(feed, "parse_feed", parse_feed)
+
+    async def run():
+        app = web.Application()
+        app.router.add_get("/feed", serve_feed)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        url = f"http://127.0.0.1:{port}/feed"
+
+        try:
+            async with aiohttp.ClientSession() as session:
+                first = await feed.fetch_feed(session, url)
+                second = await feed.fetch_feed(session, url, *first[1:])
+        finally:
+            await runner.cleanup()
+
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert first == ("parsed", ETAG, LAST_MODIFIED)
+    assert "If-None-Match" not in requests[0]
+
+    # The second poll sends the validators back and skips parsing
+    assert requests[1]["If-None-Match"] == ETAG
+    assert requests[1]["If-Modified-Since"] == LAST_MODIFIED
+    assert second == (None, ETAG, LAST_MODIFIED)
+    assert parsed == [BODY]
@@ -0,0 +1,54 @@
+import sys
+import importlib
+import sarica.essence
+import sarica.rewards
+from sarica.reload import Reloader
+
+
+def test_lazy_import_is_not_a_change():
+    sys.modules.pop("sarica.recompute", None)
+    reloader = Reloader()
+    assert "sarica.recompute" not in reloader.hashes
+
+    importlib.import_module("sarica.recompute")
+
+    changed = reloader.changed()
+    assert changed == []
+    assert not reloader.needs_restart(changed)
+    assert "sarica.recompute" in reloader.hashes
+    assert reloader.changed() == []
+
+
+def test_edited_module_is_a_change():
+    reloader = Reloader()
+    reloader.hashes["sarica.rewards"] = "stale"
+
+    changed = reloader.changed()
+    assert changed == ["sarica.rewards"]
+    assert not reloader.needs_restart(changed)
+
+    reloader.hashes["sarica.essence"] = "stale"
+    assert reloader.needs_restart(reloader.changed())
+
+
+def test_snapshot_is_additive():
+    reloader = Reloader()
+    known = dict(reloader.hashes)
+    reloader.hashes["sarica.essence"] = "stale"
+
+    reloader.snapshot(["sarica.rewards"])
+    assert reloader.hashes["sarica.essence"] == "stale"
+    assert set(reloader.hashes) == set(known)
+
+    reloader.snapshot()
+    assert reloader.hashes == known
+
+
+def test_live_state_needs_restart():
+    import sarica.state
+    import sarica.subscriptions
+
+    reloader = Reloader()
+    assert reloader.needs_restart(["sarica.state"])
+    assert reloader.needs_restart(["sarica.subscriptions"])
+    assert not reloader.needs_restart(["sarica.feed", "sarica.guild"])
@@ -0,0 +1,49 @@
+import asyncio
+import sqlite3
+from types import SimpleNamespace
+import pytest
+from sarica import feed
+from sarica.sql import Database
+from sarica.subscriptions import FeedSubscriptions
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    db = Database(guild_id=1)
+    yield db
+    db.close()
+
+
+def test_failing_feed_backs_off_alone(db, monkeypatch):
+    async def fetch_feed(session, url, etag=None, last_modified=None, timeout=30):
+        entries = [{"id": f"{url}/2"}, {"id": f"{url}/1"}]
+        return SimpleNamespace(entries=entries), None, None
+
+    update_feed = db.update_feed
+    locked = set()
+
+    async def flaky_update(feed_id, etag, last_modified, guids):
+        if feed_id in locked:
+            raise sqlite3.OperationalError("database is locked")
+        await update_feed(feed_id, etag, last_modified, guids)
+
+    monkeypatch.setattr(feed, "fetch_feed", fetch_feed)
+    monkeypatch.setattr(db, "update_feed", flaky_update)
+
+    async def run():
+        subs = FeedSubscriptions(db, session=None)
+        working = await subs.subscribe("a", 1, seen=["a/1"])
+        broken = await subs.subscribe("b", 1, seen=["b/1"])
+        locked.add(broken.feed_id)
+
+        found = await subs.poll()
+        now = asyncio.get_running_loop().time()
+        return working, broken, found, now
+
+    working, broken, found, now = asyncio.run(run())
+    assert [(sub.url, entry["id"]) for sub, entry in found] == [("a", "a/2")]
+    assert working.failures == 0
+    assert broken.failures == 1
+    assert broken.next_poll > now
+    assert "b/2" not in broken.seen